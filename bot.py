@@ -1,19 +1,32 @@
 import os
 import logging
+from datetime import timedelta
 from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackContext, CallbackQueryHandler
 from telegram import Update, ParseMode
-from database import setup_database
+from database import setup_database, expire_subscriptions, load_known_subject_codes
 from handlers import (
-    start_handler, help_handler, message_handler, verify_payment_handler,
+    start_handler, help_handler, verify_payment_handler,
     add_resource_handler, admin_verify_payment_handler, stats_handler,
-    grant_access_handler, button_callback_handler, process_resource_conversation,
+    grant_access_handler, button_callback_handler, text_handler,
     remove_resource_handler, edit_resource_handler, delete_subject_handler,
-    upload_json_handler, process_json_upload, my_history_handler, admin_panel_handler,
-    animate_resource_loading
+    upload_json_handler, process_json_upload, my_history_handler, animations_handler, admin_panel_handler,
+    animate_resource_loading, flush_admin_notifications
 )
 
 logger = logging.getLogger(__name__)
 
+# Size of the worker pool that runs asynchronous handlers and jobs
+UPDATE_WORKERS = 32
+
+# How often expired subscriptions are reset in the database
+EXPIRY_CHECK_INTERVAL = timedelta(days=1)
+
+# How often queued payment notifications are sent to the admin, in seconds
+ADMIN_NOTIFY_INTERVAL = 2
+
+# Update types the handlers below consume; everything else is filtered out by Telegram
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
 def setup_bot():
     """Set up and start the Telegram bot."""
     # Get bot token from environment variable
@@ -23,48 +36,57 @@ def setup_bot():
         raise ValueError("BOT_TOKEN not found")
 
     # Create the Updater and pass it the bot's token
-    updater = Updater(bot_token, use_context=True)
+    updater = Updater(bot_token, use_context=True, workers=UPDATE_WORKERS)
 
     # Get the dispatcher to register handlers
     dp = updater.dispatcher
 
     # Ensure database is set up
     setup_database()
+    
+    # Warm the set of subject codes that have resources
+    load_known_subject_codes()
 
-    # Register command handlers
-    dp.add_handler(CommandHandler("start", start_handler))
-    dp.add_handler(CommandHandler("help", help_handler))
-    dp.add_handler(CommandHandler("my_history", my_history_handler))
-    dp.add_handler(CommandHandler("verify_payment", verify_payment_handler))
-    dp.add_handler(CommandHandler("add_resource", add_resource_handler))
-    dp.add_handler(CommandHandler("verify", admin_verify_payment_handler))
-    dp.add_handler(CommandHandler("stats", stats_handler))
-    dp.add_handler(CommandHandler("admin", admin_panel_handler))
-    dp.add_handler(CommandHandler("grant_access", grant_access_handler))
+    # Register command handlers; every handler runs on the worker pool so a slow
+    # database or Telegram API call doesn't hold up updates from other chats
+    dp.add_handler(CommandHandler("start", start_handler, run_async=True))
+    dp.add_handler(CommandHandler("help", help_handler, run_async=True))
+    dp.add_handler(CommandHandler("my_history", my_history_handler, run_async=True))
+    dp.add_handler(CommandHandler("animations", animations_handler, run_async=True))
+    dp.add_handler(CommandHandler("verify_payment", verify_payment_handler, run_async=True))
+    dp.add_handler(CommandHandler("add_resource", add_resource_handler, run_async=True))
+    dp.add_handler(CommandHandler("verify", admin_verify_payment_handler, run_async=True))
+    dp.add_handler(CommandHandler("stats", stats_handler, run_async=True))
+    dp.add_handler(CommandHandler("admin", admin_panel_handler, run_async=True))
+    dp.add_handler(CommandHandler("grant_access", grant_access_handler, run_async=True))
     
     # Register the new resource management commands
-    dp.add_handler(CommandHandler("remove_resource", remove_resource_handler))
-    dp.add_handler(CommandHandler("edit_resource", edit_resource_handler))
-    dp.add_handler(CommandHandler("delete_subject", delete_subject_handler))
-    dp.add_handler(CommandHandler("upload_json", upload_json_handler))
+    dp.add_handler(CommandHandler("remove_resource", remove_resource_handler, run_async=True))
+    dp.add_handler(CommandHandler("edit_resource", edit_resource_handler, run_async=True))
+    dp.add_handler(CommandHandler("delete_subject", delete_subject_handler, run_async=True))
+    dp.add_handler(CommandHandler("upload_json", upload_json_handler, run_async=True))
     
     # Register document handler for JSON uploads
-    dp.add_handler(MessageHandler(Filters.document.file_extension("json"), process_json_upload))
+    dp.add_handler(MessageHandler(Filters.document.file_extension("json"), process_json_upload, run_async=True))
 
-    # Register message handlers in order of precedence
-    # First check if it's part of a resource addition conversation
-    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, process_resource_conversation))
-    # Then process normal messages with subject code detection
-    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, message_handler))
+    # Register a single text handler; it routes to the resource addition
+    # conversation or to subject code detection based on the user's state
+    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, text_handler, run_async=True))
     
     # Register callback query handler for inline keyboard buttons
-    dp.add_handler(CallbackQueryHandler(button_callback_handler))
+    dp.add_handler(CallbackQueryHandler(button_callback_handler, run_async=True))
 
     # Log all errors
     dp.add_error_handler(error_handler)
 
+    # Periodically reset expired subscriptions instead of doing it per message
+    updater.job_queue.run_repeating(expire_subscriptions_job, interval=EXPIRY_CHECK_INTERVAL, first=0)
+
+    # Send payment verification requests to the admin in batches
+    updater.job_queue.run_repeating(flush_admin_notifications, interval=ADMIN_NOTIFY_INTERVAL)
+
     # Start the Bot
-    updater.start_polling()
+    updater.start_polling(allowed_updates=ALLOWED_UPDATES)
     logger.info("Bot started successfully!")
 
     # Run the bot until you press Ctrl-C
@@ -73,3 +95,9 @@ def setup_bot():
 def error_handler(update: Update, context: CallbackContext):
     """Log Errors caused by Updates."""
     logger.warning(f'Update "{update}" caused error "{context.error}"')
+
+def expire_subscriptions_job(context: CallbackContext):
+    """Job callback that resets expired subscriptions."""
+    expired = expire_subscriptions()
+    if expired:
+        logger.info(f"Reset {expired} expired subscription(s)")
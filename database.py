@@ -1,31 +1,303 @@
 import sqlite3
 import logging
 import os
-from datetime import datetime, timedelta
+import atexit
+import threading
+import time
+import json
+from collections import Counter, namedtuple
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 DB_PATH = "bot_data.db"
 
+# Length of a paid subscription, in seconds (1 week)
+SUBSCRIPTION_SECONDS = 7 * 24 * 60 * 60
+
+# SQL for the per-message hot path, kept as constants so every call reuses
+# the same prepared statement from the connection's statement cache
+SQL_GET_USER = "SELECT * FROM users WHERE telegram_id = ?"
+SQL_CREATE_USER = "INSERT OR IGNORE INTO users (telegram_id, search_count) VALUES (?, 0)"
+SQL_ADD_SEARCH_COUNT = "UPDATE users SET search_count = search_count + ? WHERE telegram_id = ?"
+SQL_GET_SEARCH_COUNT = "SELECT search_count FROM users WHERE telegram_id = ?"
+SQL_GET_USER_STATE = """
+    SELECT
+        is_paid = 1 AND expiry_ts > ?,
+        search_count,
+        EXISTS(SELECT 1 FROM pending_payments WHERE telegram_id = users.telegram_id AND status = 'verified')
+    FROM users WHERE telegram_id = ?
+"""
+SQL_GET_USER_HISTORY = """
+    SELECT is_paid = 1 AND expiry_ts > ?, search_count, expiry_ts
+    FROM users WHERE telegram_id = ?
+"""
+SQL_COUNT_PENDING_PAYMENTS = "SELECT COUNT(*) FROM pending_payments WHERE status = 'pending'"
+SQL_CHECK_SUBSCRIPTION = "SELECT is_paid = 1 AND expiry_ts > ? FROM users WHERE telegram_id = ?"
+SQL_GET_RESOURCES = """
+    SELECT subject_name, unit_number, notes_link, ppt_link, pyq_link
+    FROM resources
+    WHERE subject_code = ?
+    ORDER BY unit_number
+"""
+SQL_ADD_SUBJECT_ACCESS = """
+    INSERT INTO subject_access (subject_code, access_count) VALUES (?, ?)
+    ON CONFLICT(subject_code) DO UPDATE SET access_count = access_count + excluded.access_count
+"""
+
+# Insert a resource row, or fill in the supplied links on the existing (subject, unit) row
+SQL_UPSERT_RESOURCE = """
+    INSERT INTO resources (subject_code, subject_name, unit_number, notes_link, ppt_link, pyq_link)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(subject_code, unit_number) DO UPDATE SET
+        subject_name = excluded.subject_name,
+        notes_link = COALESCE(excluded.notes_link, notes_link),
+        ppt_link = COALESCE(excluded.ppt_link, ppt_link),
+        pyq_link = COALESCE(excluded.pyq_link, pyq_link)
+"""
+SQL_UPSERT_RESOURCE_RETURNING_ID = SQL_UPSERT_RESOURCE + "    RETURNING id\n"
+
+# Fold duplicate (subject, unit) rows from before the unique index into the newest
+# row, keeping the newest non-NULL value of each column, as the upsert would
+SQL_MERGE_DUPLICATE_RESOURCES = """
+    UPDATE resources SET
+        subject_name = (SELECT d.subject_name FROM resources d
+            WHERE d.subject_code = resources.subject_code AND d.unit_number = resources.unit_number
+            AND d.subject_name IS NOT NULL ORDER BY d.id DESC LIMIT 1),
+        notes_link = (SELECT d.notes_link FROM resources d
+            WHERE d.subject_code = resources.subject_code AND d.unit_number = resources.unit_number
+            AND d.notes_link IS NOT NULL ORDER BY d.id DESC LIMIT 1),
+        ppt_link = (SELECT d.ppt_link FROM resources d
+            WHERE d.subject_code = resources.subject_code AND d.unit_number = resources.unit_number
+            AND d.ppt_link IS NOT NULL ORDER BY d.id DESC LIMIT 1),
+        pyq_link = (SELECT d.pyq_link FROM resources d
+            WHERE d.subject_code = resources.subject_code AND d.unit_number = resources.unit_number
+            AND d.pyq_link IS NOT NULL ORDER BY d.id DESC LIMIT 1)
+    WHERE id IN (
+        SELECT MAX(id) FROM resources
+        WHERE subject_code IS NOT NULL AND unit_number IS NOT NULL
+        GROUP BY subject_code, unit_number HAVING COUNT(*) > 1
+    )
+"""
+SQL_DELETE_DUPLICATE_RESOURCES = """
+    DELETE FROM resources
+    WHERE subject_code IS NOT NULL AND unit_number IS NOT NULL
+    AND id NOT IN (SELECT MAX(id) FROM resources GROUP BY subject_code, unit_number)
+"""
+
+# Seconds between background flushes of the buffered usage counters
+COUNTER_FLUSH_INTERVAL = 3
+
+# Number of buffered counter entries that triggers a flush before the interval is up
+COUNTER_FLUSH_MAX_PENDING = 500
+
+# Per-connection settings; journal_mode=WAL is also persisted in the database file,
+# and wal_autocheckpoint keeps the -wal file from growing without bound
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA wal_autocheckpoint=1000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA foreign_keys=ON",
+)
+
+# Each thread keeps one persistent connection so SQLite's page cache stays warm
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+
+def _get_conn():
+    """Return this thread's database connection, opening it on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        _local.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+def _close_all():
+    """Close every connection opened by _get_conn()."""
+    with _connections_lock:
+        while _connections:
+            _connections.pop().close()
+
+atexit.register(_close_all)
+
+class _TTLCache:
+    """Small thread-safe cache whose entries expire after ttl seconds."""
+
+    _MISSING = object()
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, self._MISSING)
+            if entry is self._MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if key not in self._data and len(self._data) >= self.maxsize:
+                # Evict the oldest entry, dicts keep insertion order
+                del self._data[next(iter(self._data))]
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# Read-mostly lookups hit on every user message
+_subscription_cache = _TTLCache(maxsize=10000, ttl=60)
+_resources_cache = _TTLCache(maxsize=1024, ttl=300)
+
+# Aggregate stats for the admin panels and the web status page. Behind the
+# in-process cache, the bot keeps a snapshot in the stats_snapshot table that the
+# web workers read. Writes that change the stats bump stats_version in their own
+# transaction, so a snapshot from an older version is ignored everywhere; the
+# TTLs only bound drift from changes that don't bump it (new users, usage
+# counters, subscriptions running out).
+STATS_CACHE_TTL = 10
+STATS_SNAPSHOT_TTL = 10
+_stats_cache = _TTLCache(maxsize=1, ttl=STATS_CACHE_TTL)
+# Set by setup_database: only the bot process writes the shared snapshot, the
+# web workers just read it
+_stats_snapshot_writer = False
+
+# Every subject code that has resources, loaded on first use and kept in sync by
+# the resource write paths; lets lookups for unknown codes skip SQLite entirely
+_known_subject_codes = None
+_known_subject_codes_lock = threading.Lock()
+
+# Usage counters are buffered in memory and written in one transaction per flush
+_search_deltas = Counter()
+_access_deltas = Counter()
+# Search increments a running flush has taken out of _search_deltas but not yet
+# committed; readers add them in so a search is never missing from both places
+_flushing_searches = Counter()
+_deltas_lock = threading.Lock()
+# Serializes flushes; only the flush itself waits on the disk write
+_flush_lock = threading.Lock()
+_flusher_started = False
+
+def _start_counter_flusher():
+    """Start the background thread that flushes buffered counters."""
+    global _flusher_started
+    if _flusher_started:
+        return
+    with _deltas_lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+    
+    def run():
+        while True:
+            time.sleep(COUNTER_FLUSH_INTERVAL)
+            flush_counters()
+    
+    threading.Thread(target=run, name="counter-flusher", daemon=True).start()
+
+def flush_counters():
+    """Write buffered search and subject access increments to the database."""
+    global _search_deltas, _access_deltas, _flushing_searches
+    with _flush_lock:
+        # Swap the buffers out under the lock and write them without it, so
+        # increments and lookups don't wait on the write transaction
+        with _deltas_lock:
+            if not _search_deltas and not _access_deltas:
+                return True
+            searches, _search_deltas = _search_deltas, Counter()
+            accesses, _access_deltas = _access_deltas, Counter()
+            _flushing_searches = searches
+        
+        try:
+            conn = _get_conn()
+            with conn:
+                conn.executemany(
+                    SQL_ADD_SEARCH_COUNT,
+                    [(count, telegram_id) for telegram_id, count in searches.items()]
+                )
+                conn.executemany(SQL_ADD_SUBJECT_ACCESS, list(accesses.items()))
+            flushed = True
+        except sqlite3.Error as e:
+            logger.error("Database error in flush_counters: %s", e)
+            flushed = False
+        
+        with _deltas_lock:
+            if not flushed:
+                # Merge the deltas back so the next flush retries them
+                _search_deltas.update(searches)
+                _access_deltas.update(accesses)
+            _flushing_searches = Counter()
+        return flushed
+
+def _pending_searches(telegram_id):
+    """Get a user's searches that are not in the users table yet.
+    
+    Read this before querying the table: a flush committing in between can then
+    only count a search twice for a moment, never drop it.
+    """
+    with _deltas_lock:
+        return _search_deltas.get(telegram_id, 0) + _flushing_searches.get(telegram_id, 0)
+
+atexit.register(flush_counters)
+
 def setup_database():
     """Create database tables if they don't exist."""
+    global _stats_snapshot_writer
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        conn = _get_conn()
+
+        # Switch the database file to WAL so readers don't block on writers
+        journal_mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        if journal_mode.lower() != "wal":
+            logger.warning("Could not enable WAL mode, journal_mode is %s", journal_mode)
 
         # Create users table
-        cursor.execute('''
+        conn.execute('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY,
             telegram_id INTEGER UNIQUE,
             search_count INTEGER DEFAULT 0,
             is_paid BOOLEAN DEFAULT 0,
-            expiry_date TEXT
+            expiry_ts INTEGER
         )
         ''')
 
+        # Migrate the old TEXT expiry_date column to a unix timestamp
+        user_columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+        if "expiry_date" in user_columns:
+            if "expiry_ts" not in user_columns:
+                conn.execute("ALTER TABLE users ADD COLUMN expiry_ts INTEGER")
+            # Old values were written in local time
+            conn.execute(
+                "UPDATE users SET expiry_ts = CAST(strftime('%s', expiry_date, 'utc') AS INTEGER) "
+                "WHERE expiry_date IS NOT NULL"
+            )
+            conn.execute("ALTER TABLE users DROP COLUMN expiry_date")
+            conn.commit()
+            logger.info("Migrated users.expiry_date to expiry_ts")
+
         # Create resources table
-        cursor.execute('''
+        conn.execute('''
         CREATE TABLE IF NOT EXISTS resources (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             subject_code TEXT,
@@ -38,7 +310,7 @@ def setup_database():
         ''')
         
         # Create pending payments table
-        cursor.execute('''
+        conn.execute('''
         CREATE TABLE IF NOT EXISTS pending_payments (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             telegram_id INTEGER,
@@ -49,7 +321,7 @@ def setup_database():
         ''')
         
         # Create subject access tracker table
-        cursor.execute('''
+        conn.execute('''
         CREATE TABLE IF NOT EXISTS subject_access (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             subject_code TEXT UNIQUE,
@@ -57,625 +329,773 @@ def setup_database():
         )
         ''')
         
+        # Create the shared stats snapshot table and the version the writes bump
+        # (see get_cached_user_stats)
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS stats_snapshot (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at INTEGER NOT NULL,
+            version INTEGER NOT NULL DEFAULT -1
+        )
+        ''')
+        snapshot_columns = [row[1] for row in conn.execute("PRAGMA table_info(stats_snapshot)")]
+        if "version" not in snapshot_columns:
+            conn.execute("ALTER TABLE stats_snapshot ADD COLUMN version INTEGER NOT NULL DEFAULT -1")
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS stats_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+        ''')
+        conn.execute("INSERT OR IGNORE INTO stats_version (id, version) VALUES (1, 0)")
+        
+        # Index the lookup columns; users.telegram_id and pending_payments.reference_id
+        # are already covered by their UNIQUE constraints
+        _create_resources_unique_index(conn)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_pending_status ON pending_payments(status, request_time)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_pending_tid_status ON pending_payments(telegram_id, status)"
+        )
+        
         conn.commit()
+        
+        # This is the bot process; it maintains the shared stats snapshot
+        _stats_snapshot_writer = True
+        
+        # Refresh planner statistics so the new indexes are used
+        conn.execute("ANALYZE")
         logger.info("Database initialized successfully")
     except sqlite3.Error as e:
-        logger.error(f"Database error: {e}")
-    finally:
-        if conn:
-            conn.close()
+        # The bot can't run without its tables and the upsert index
+        logger.error("Database error: %s", e)
+        raise
+
+def _create_resources_unique_index(conn):
+    """Create the (subject_code, unit_number) unique index the resource upserts rely on.
+    
+    Databases from before the index may hold several rows per subject and unit;
+    they are merged into one first, in the same transaction as the index.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_resources_code_unit'"
+    ).fetchone()
+    if exists:
+        return
+    with conn:
+        conn.execute(SQL_MERGE_DUPLICATE_RESOURCES)
+        removed = conn.execute(SQL_DELETE_DUPLICATE_RESOURCES).rowcount
+        conn.execute(
+            "CREATE UNIQUE INDEX idx_resources_code_unit ON resources(subject_code, unit_number)"
+        )
+    if removed:
+        logger.info("Merged %d duplicate resource rows before creating the unique index", removed)
 
 def get_user(telegram_id):
     """Get user information from the database."""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-        return cursor.fetchone()
+        conn = _get_conn()
+        return conn.execute(SQL_GET_USER, (telegram_id,)).fetchone()
     except sqlite3.Error as e:
-        logger.error(f"Database error in get_user: {e}")
+        logger.error("Database error in get_user: %s", e)
         return None
-    finally:
-        if conn:
-            conn.close()
 
 def create_user(telegram_id, username=None):
-    """Create a new user in the database."""
-    conn = None
+    """Create a new user in the database; does nothing if the user already exists."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO users (telegram_id, search_count) VALUES (?, ?)",
-            (telegram_id, 0)
-        )
-        conn.commit()
+        conn = _get_conn()
+        with conn:
+            conn.execute(SQL_CREATE_USER, (telegram_id,))
         return True
     except sqlite3.Error as e:
-        logger.error(f"Database error in create_user: {e}")
+        logger.error("Database error in create_user: %s", e)
         return False
-    finally:
-        if conn:
-            conn.close()
 
-def increment_search_count(telegram_id):
-    """Increment the search count for a user."""
-    conn = None
+def increment_search_count(telegram_id, flush=False):
+    """Increment the search count for a user (buffered until the next flush).
+
+    Pass flush=True to write the buffered counters right away, e.g. when this
+    search uses up the user's free quota and must not be lost on a crash.
+    """
+    with _deltas_lock:
+        _search_deltas[telegram_id] += 1
+        flush = flush or len(_search_deltas) + len(_access_deltas) >= COUNTER_FLUSH_MAX_PENDING
+    _start_counter_flusher()
+    if flush:
+        flush_counters()
+    return True
+
+# Everything message_handler needs to know about a user before serving a lookup
+UserState = namedtuple("UserState", ["is_subscribed", "search_count", "had_prior_subscription"])
+
+def get_user_state(telegram_id):
+    """Get a user's subscription and search state in one query, creating the user if needed."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET search_count = search_count + 1 WHERE telegram_id = ?",
-            (telegram_id,)
-        )
-        conn.commit()
-        return True
+        conn = _get_conn()
+        pending = _pending_searches(telegram_id)
+        row = conn.execute(SQL_GET_USER_STATE, (int(time.time()), telegram_id)).fetchone()
+        if row is None:
+            with conn:
+                conn.execute(SQL_CREATE_USER, (telegram_id,))
+            row = conn.execute(SQL_GET_USER_STATE, (int(time.time()), telegram_id)).fetchone()
+        
+        is_subscribed, search_count, had_prior = row
+        is_subscribed = bool(is_subscribed)
+        _subscription_cache.set(telegram_id, is_subscribed)
+        return UserState(is_subscribed, search_count + pending, bool(had_prior))
     except sqlite3.Error as e:
-        logger.error(f"Database error in increment_search_count: {e}")
-        return False
-    finally:
-        if conn:
-            conn.close()
+        logger.error("Database error in get_user_state: %s", e)
+        return UserState(False, 0, False)
+
+# What /my_history reports about a user
+UserHistory = namedtuple("UserHistory", ["search_count", "is_subscribed", "expiry"])
+
+def get_user_history(telegram_id):
+    """Get a user's search count, subscription status and expiry in one query.
+    
+    Returns None if the user doesn't exist. The expiry is a datetime while the
+    subscription is active, otherwise None.
+    """
+    try:
+        conn = _get_conn()
+        pending = _pending_searches(telegram_id)
+        row = conn.execute(SQL_GET_USER_HISTORY, (int(time.time()), telegram_id)).fetchone()
+        if row is None:
+            return None
+        
+        is_subscribed, search_count, expiry_ts = row
+        is_subscribed = bool(is_subscribed)
+        _subscription_cache.set(telegram_id, is_subscribed)
+        expiry = datetime.fromtimestamp(expiry_ts) if is_subscribed else None
+        return UserHistory(search_count + pending, is_subscribed, expiry)
+    except sqlite3.Error as e:
+        logger.error("Database error in get_user_history: %s", e)
+        return None
 
 def get_search_count(telegram_id):
-    """Get the current search count for a user."""
-    conn = None
+    """Get the current search count for a user, including unflushed increments."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT search_count FROM users WHERE telegram_id = ?", (telegram_id,))
-        result = cursor.fetchone()
-        return result[0] if result else 0
+        conn = _get_conn()
+        pending = _pending_searches(telegram_id)
+        result = conn.execute(SQL_GET_SEARCH_COUNT, (telegram_id,)).fetchone()
+        return (result[0] if result else 0) + pending
     except sqlite3.Error as e:
-        logger.error(f"Database error in get_search_count: {e}")
+        logger.error("Database error in get_search_count: %s", e)
         return 0
-    finally:
-        if conn:
-            conn.close()
 
 def add_pending_payment(telegram_id, reference_id):
     """Add a pending payment to the database."""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        cursor.execute(
-            "INSERT INTO pending_payments (telegram_id, reference_id, request_time) VALUES (?, ?, ?)",
-            (telegram_id, reference_id, now)
-        )
-        conn.commit()
+        conn = _get_conn()
+        with conn:
+            now = datetime.now().isoformat(sep=" ", timespec="seconds")
+            conn.execute(
+                "INSERT INTO pending_payments (telegram_id, reference_id, request_time) VALUES (?, ?, ?)",
+                (telegram_id, reference_id, now)
+            )
+            _bump_stats_version(conn)
+        _invalidate_stats()
         return True
     except sqlite3.Error as e:
-        logger.error(f"Database error in add_pending_payment: {e}")
+        logger.error("Database error in add_pending_payment: %s", e)
         return False
-    finally:
-        if conn:
-            conn.close()
 
 def verify_payment(reference_id, telegram_id=None):
     """Verify a payment by reference ID and activate subscription."""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Find the pending payment
-        if telegram_id:
-            cursor.execute(
-                "SELECT telegram_id FROM pending_payments WHERE reference_id = ? AND telegram_id = ?",
-                (reference_id, telegram_id)
-            )
-        else:
-            cursor.execute(
-                "SELECT telegram_id FROM pending_payments WHERE reference_id = ? AND status = 'pending'",
-                (reference_id,)
-            )
-            
-        result = cursor.fetchone()
-        
-        if not result:
-            return False
+        conn = _get_conn()
+        with conn:
+            # Find the pending payment
+            if telegram_id:
+                result = conn.execute(
+                    "SELECT telegram_id FROM pending_payments WHERE reference_id = ? AND telegram_id = ?",
+                    (reference_id, telegram_id)
+                ).fetchone()
+            else:
+                result = conn.execute(
+                    "SELECT telegram_id FROM pending_payments WHERE reference_id = ? AND status = 'pending'",
+                    (reference_id,)
+                ).fetchone()
+        
+            if not result:
+                return False
             
-        payment_telegram_id = result[0]
+            payment_telegram_id = result[0]
         
-        # Mark payment as verified
-        cursor.execute(
-            "UPDATE pending_payments SET status = 'verified' WHERE reference_id = ?",
-            (reference_id,)
-        )
+            # Mark payment as verified
+            conn.execute(
+                "UPDATE pending_payments SET status = 'verified' WHERE reference_id = ?",
+                (reference_id,)
+            )
         
-        # Set payment status and expiry date (1 week from now)
-        expiry_date = (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")
-        cursor.execute(
-            "UPDATE users SET is_paid = 1, expiry_date = ? WHERE telegram_id = ?",
-            (expiry_date, payment_telegram_id)
-        )
+            # Set payment status and expiry time (1 week from now)
+            expiry_ts = int(time.time()) + SUBSCRIPTION_SECONDS
+            conn.execute(
+                "UPDATE users SET is_paid = 1, expiry_ts = ? WHERE telegram_id = ?",
+                (expiry_ts, payment_telegram_id)
+            )
+            _bump_stats_version(conn)
         
-        conn.commit()
+        _subscription_cache.pop(payment_telegram_id)
+        _invalidate_stats()
         return payment_telegram_id
     except sqlite3.Error as e:
-        logger.error(f"Database error in verify_payment: {e}")
+        logger.error("Database error in verify_payment: %s", e)
         return False
-    finally:
-        if conn:
-            conn.close()
 
 def grant_access(telegram_id):
     """Grant subscription access to a user directly by telegram_id."""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Check if user exists
-        cursor.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
-        result = cursor.fetchone()
-        
-        if not result:
-            # User doesn't exist, create them first
-            create_user(telegram_id)
-        
-        # Set payment status and expiry date (1 week from now)
-        expiry_date = (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")
-        cursor.execute(
-            "UPDATE users SET is_paid = 1, expiry_date = ? WHERE telegram_id = ?",
-            (expiry_date, telegram_id)
-        )
+        conn = _get_conn()
+        with conn:
+            # Create the user first if they don't exist yet
+            conn.execute(SQL_CREATE_USER, (telegram_id,))
+        
+            # Set payment status and expiry time (1 week from now)
+            expiry_ts = int(time.time()) + SUBSCRIPTION_SECONDS
+            conn.execute(
+                "UPDATE users SET is_paid = 1, expiry_ts = ? WHERE telegram_id = ?",
+                (expiry_ts, telegram_id)
+            )
+            _bump_stats_version(conn)
         
-        conn.commit()
+        _subscription_cache.pop(telegram_id)
+        _invalidate_stats()
         return True
     except sqlite3.Error as e:
-        logger.error(f"Database error in grant_access: {e}")
+        logger.error("Database error in grant_access: %s", e)
         return False
-    finally:
-        if conn:
-            conn.close()
 
 def check_subscription(telegram_id):
     """Check if a user has an active subscription."""
-    conn = None
+    is_subscribed = _subscription_cache.get(telegram_id)
+    if is_subscribed is not None:
+        return is_subscribed
+    
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT is_paid, expiry_date FROM users WHERE telegram_id = ?",
-            (telegram_id,)
-        )
-        result = cursor.fetchone()
+        conn = _get_conn()
+        # Compare the expiry in SQL; expired rows are reset by expire_subscriptions()
+        result = conn.execute(SQL_CHECK_SUBSCRIPTION, (int(time.time()), telegram_id)).fetchone()
         
-        if not result:
-            return False
-            
-        is_paid, expiry_date = result
-        
-        if not is_paid:
-            return False
-            
-        if not expiry_date:
-            return False
-            
-        # Check if subscription has expired
-        now = datetime.now()
-        expiry = datetime.strptime(expiry_date, "%Y-%m-%d %H:%M:%S")
-        
-        if now > expiry:
-            # Reset payment status if expired
-            cursor.execute(
-                "UPDATE users SET is_paid = 0, expiry_date = NULL WHERE telegram_id = ?",
-                (telegram_id,)
-            )
-            conn.commit()
-            return False
-            
-        return True
+        is_subscribed = bool(result and result[0])
+        _subscription_cache.set(telegram_id, is_subscribed)
+        return is_subscribed
     except sqlite3.Error as e:
-        logger.error(f"Database error in check_subscription: {e}")
+        logger.error("Database error in check_subscription: %s", e)
         return False
-    finally:
-        if conn:
-            conn.close()
+
+def expire_subscriptions():
+    """Reset the payment status of every user whose subscription has expired."""
+    try:
+        conn = _get_conn()
+        with conn:
+            # Only rows that are still marked paid are touched, so each expiry is written once
+            expired_ids = conn.execute("""
+                UPDATE users SET is_paid = 0, expiry_ts = NULL
+                WHERE is_paid = 1 AND expiry_ts <= ?
+                RETURNING telegram_id
+            """, (int(time.time()),)).fetchall()
+            if expired_ids:
+                _bump_stats_version(conn)
+        
+        # Evict just the users that changed instead of the whole cache
+        for (telegram_id,) in expired_ids:
+            _subscription_cache.pop(telegram_id)
+        if expired_ids:
+            _invalidate_stats()
+        return len(expired_ids)
+    except sqlite3.Error as e:
+        logger.error("Database error in expire_subscriptions: %s", e)
+        return 0
 
 def get_subscription_expiry(telegram_id):
     """Get the expiry date of a user's subscription."""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
+        conn = _get_conn()
         # Check user table first for expiry date
-        cursor.execute(
-            "SELECT is_paid, expiry_date FROM users WHERE telegram_id = ?",
+        result = conn.execute(
+            "SELECT is_paid, expiry_ts FROM users WHERE telegram_id = ?",
             (telegram_id,)
-        )
-        result = cursor.fetchone()
+        ).fetchone()
         
         if not result:
             return None
             
-        is_paid, expiry_date = result
+        is_paid, expiry_ts = result
         
-        if not is_paid or not expiry_date:
+        if not is_paid or not expiry_ts:
             return None
             
-        # Parse expiry date
-        expiry = datetime.strptime(expiry_date, "%Y-%m-%d %H:%M:%S")
-        
         # Check if already expired
-        now = datetime.now()
-        if now > expiry:
+        if expiry_ts <= time.time():
             return None
             
-        return expiry
+        return datetime.fromtimestamp(expiry_ts)
     except sqlite3.Error as e:
-        logger.error(f"Database error in get_subscription_expiry: {e}")
+        logger.error("Database error in get_subscription_expiry: %s", e)
         return None
-    finally:
-        if conn:
-            conn.close()
 
 def add_resource(subject_code, subject_name, unit_number, notes_link=None, ppt_link=None, pyq_link=None):
-    """Add or update a resource in the database."""
-    conn = None
+    """Add or update a resource in the database.
+
+    Returns the id of the inserted or updated row, or False on error.
+    """
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Check if the entry exists
-        cursor.execute(
-            "SELECT id FROM resources WHERE subject_code = ? AND unit_number = ?",
-            (subject_code.upper(), unit_number)
-        )
-        
-        existing_id = cursor.fetchone()
-        
-        if existing_id:
-            # Update existing entry
-            update_query = "UPDATE resources SET subject_name = ?"
-            params = [subject_name]
+        conn = _get_conn()
+        with conn:
+            resource_id = conn.execute(
+                SQL_UPSERT_RESOURCE_RETURNING_ID,
+                (subject_code.upper(), subject_name, unit_number,
+                 notes_link or None, ppt_link or None, pyq_link or None)
+            ).fetchone()[0]
+            _bump_stats_version(conn)
             
-            if notes_link:
-                update_query += ", notes_link = ?"
-                params.append(notes_link)
-                
-            if ppt_link:
-                update_query += ", ppt_link = ?"
-                params.append(ppt_link)
-                
-            if pyq_link:
-                update_query += ", pyq_link = ?"
-                params.append(pyq_link)
-                
-            update_query += " WHERE id = ?"
-            params.append(existing_id[0])
-            
-            cursor.execute(update_query, params)
-        else:
-            # Insert new entry
-            cursor.execute(
-                """INSERT INTO resources (subject_code, subject_name, unit_number, notes_link, ppt_link, pyq_link) 
-                VALUES (?, ?, ?, ?, ?, ?)""",
-                (subject_code.upper(), subject_name, unit_number, notes_link, ppt_link, pyq_link)
-            )
-            
-        conn.commit()
-        return True
+        _resources_cache.pop(subject_code.upper())
+        _invalidate_stats()
+        _add_known_subject(subject_code.upper())
+        return resource_id
     except sqlite3.Error as e:
-        logger.error(f"Database error in add_resource: {e}")
+        logger.error("Database error in add_resource: %s", e)
         return False
-    finally:
-        if conn:
-            conn.close()
+
+def _merge_resource_rows(rows):
+    """Fold rows for the same (subject_code, unit_number) into one, as consecutive upserts would.
+    
+    The last subject name wins and each link keeps the last non-empty value.
+    Returns (merged_rows, owners) where owners[j] lists the positions in rows
+    that were folded into merged_rows[j].
+    """
+    merged = {}
+    for pos, (subject_code, subject_name, unit_number, notes_link, ppt_link, pyq_link) in enumerate(rows):
+        entry = merged.get((subject_code, unit_number))
+        if entry is None:
+            merged[(subject_code, unit_number)] = (
+                [subject_code, subject_name, unit_number, notes_link, ppt_link, pyq_link], [pos]
+            )
+            continue
+        row, owners = entry
+        row[1] = subject_name
+        if notes_link is not None:
+            row[3] = notes_link
+        if ppt_link is not None:
+            row[4] = ppt_link
+        if pyq_link is not None:
+            row[5] = pyq_link
+        owners.append(pos)
+    
+    return [row for row, _ in merged.values()], [owners for _, owners in merged.values()]
+
+def bulk_add_resources(rows):
+    """Add or update many resources in a single transaction.
+
+    Each row is (subject_code, subject_name, unit_number, notes_link, ppt_link, pyq_link)
+    with the subject code already upper-cased. Rows for the same subject unit are
+    merged first, so each unit is written once.
+
+    Returns a list of booleans, one per row, telling whether that row was stored.
+    If the batch fails as a whole, the rows are retried one by one so a single
+    bad row doesn't reject the rest.
+    """
+    try:
+        conn = _get_conn()
+    except sqlite3.Error as e:
+        logger.error("Database error in bulk_add_resources: %s", e)
+        return [False] * len(rows)
+    
+    merged_rows, owners = _merge_resource_rows(rows)
+    try:
+        with conn:
+            conn.executemany(SQL_UPSERT_RESOURCE, merged_rows)
+            _bump_stats_version(conn)
+        merged_mask = [True] * len(merged_rows)
+    except sqlite3.Error as e:
+        logger.error("Database error in bulk_add_resources, retrying rows individually: %s", e)
+        merged_mask = []
+        for row in merged_rows:
+            try:
+                with conn:
+                    conn.execute(SQL_UPSERT_RESOURCE, row)
+                    _bump_stats_version(conn)
+                merged_mask.append(True)
+            except sqlite3.Error as e:
+                logger.error("Database error in bulk_add_resources for %s unit %s: %s", row[0], row[2], e)
+                merged_mask.append(False)
+    
+    # Report every input row with the outcome of the merged row it went into
+    mask = [False] * len(rows)
+    for positions, ok in zip(owners, merged_mask):
+        for pos in positions:
+            mask[pos] = ok
+    
+    for subject_code in {row[0] for row, ok in zip(merged_rows, merged_mask) if ok}:
+        _resources_cache.pop(subject_code)
+        _add_known_subject(subject_code)
+    if any(merged_mask):
+        _invalidate_stats()
+    return mask
+
+def load_known_subject_codes():
+    """(Re)load the set of subject codes that have resources."""
+    global _known_subject_codes
+    try:
+        conn = _get_conn()
+        codes = {row[0] for row in conn.execute("SELECT DISTINCT subject_code FROM resources")}
+        with _known_subject_codes_lock:
+            _known_subject_codes = codes
+        return codes
+    except sqlite3.Error as e:
+        logger.error("Database error in load_known_subject_codes: %s", e)
+        return set()
+
+def is_known_subject(subject_code):
+    """Check whether any resources exist for a subject code, without querying the database."""
+    codes = _known_subject_codes
+    if codes is None:
+        codes = load_known_subject_codes()
+    return subject_code.upper() in codes
+
+def _add_known_subject(subject_code):
+    with _known_subject_codes_lock:
+        if _known_subject_codes is not None:
+            _known_subject_codes.add(subject_code)
+
+def _discard_known_subject(subject_code):
+    with _known_subject_codes_lock:
+        if _known_subject_codes is not None:
+            _known_subject_codes.discard(subject_code)
 
 def get_resources(subject_code):
     """Get all resources for a subject code with placeholders for all 6 units."""
-    conn = None
+    subject_code = subject_code.upper()
+    cached = _resources_cache.get(subject_code)
+    if cached is not None:
+        return cached
+    
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # First, get subject name
-        cursor.execute(
-            "SELECT DISTINCT subject_name FROM resources WHERE subject_code = ? LIMIT 1",
-            (subject_code.upper(),)
-        )
-        subject_row = cursor.fetchone()
+        conn = _get_conn()
+        
+        # Fetch the subject name alongside every unit row in one query
+        rows = conn.execute(SQL_GET_RESOURCES, (subject_code,)).fetchall()
         
-        if not subject_row:
+        if not rows:
+            _resources_cache.set(subject_code, (None, None))
             return None, None
             
-        subject_name = subject_row['subject_name']
-        
-        # Then get all resources
-        cursor.execute(
-            """
-            SELECT unit_number, notes_link, ppt_link, pyq_link 
-            FROM resources 
-            WHERE subject_code = ? 
-            ORDER BY unit_number
-            """,
-            (subject_code.upper(),)
-        )
+        subject_name = rows[0][0]
         
         # Initialize with empty placeholders for all 6 units
-        resources = {}
-        for unit in range(1, 7):  # Units 1-6
-            resources[unit] = {}
+        resources = {unit: {} for unit in range(1, 7)}
         
         # Fill in available resources
-        for row in cursor.fetchall():
-            unit = row['unit_number']
-            notes_link = row['notes_link']
-            ppt_link = row['ppt_link']
-            pyq_link = row['pyq_link']
-            
+        for _, unit, notes_link, ppt_link, pyq_link in rows:
+            unit_resources = resources[unit]
             if notes_link:
-                resources[unit]['notes'] = notes_link
+                unit_resources['notes'] = notes_link
             if ppt_link:
-                resources[unit]['ppt'] = ppt_link
+                unit_resources['ppt'] = ppt_link
             if pyq_link:
-                resources[unit]['pyq'] = pyq_link
+                unit_resources['pyq'] = pyq_link
             
+        _resources_cache.set(subject_code, (subject_name, resources))
         return subject_name, resources
     except sqlite3.Error as e:
-        logger.error(f"Database error in get_resources: {e}")
+        logger.error("Database error in get_resources: %s", e)
         return None, None
-    finally:
-        if conn:
-            conn.close()
+
+def get_subject_name(subject_code):
+    """Get the name stored for a subject code, or None if the subject has no resources."""
+    # Served from the resources cache, which the admin write paths already invalidate
+    subject_name, _ = get_resources(subject_code)
+    return subject_name
 
 def remove_resource(subject_code, unit_number, resource_type):
     """Remove a specific resource (notes, ppt, or pyq) for a subject and unit."""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Check if the entry exists
-        cursor.execute(
-            "SELECT id, notes_link, ppt_link, pyq_link FROM resources WHERE subject_code = ? AND unit_number = ?",
-            (subject_code.upper(), unit_number)
-        )
-        
-        existing = cursor.fetchone()
-        
-        if not existing:
-            return False, "Resource not found"
-        
-        resource_id, notes_link, ppt_link, pyq_link = existing
-        
-        # Prepare update query based on resource type
-        if resource_type == 'notes':
-            if not notes_link:
-                return False, "Notes resource not found"
-            update_query = "UPDATE resources SET notes_link = NULL WHERE id = ?"
-        elif resource_type == 'ppt':
-            if not ppt_link:
-                return False, "PPT resource not found"
-            update_query = "UPDATE resources SET ppt_link = NULL WHERE id = ?"
-        elif resource_type == 'pyq':
-            if not pyq_link:
-                return False, "PYQ resource not found"
-            update_query = "UPDATE resources SET pyq_link = NULL WHERE id = ?"
-        else:
-            return False, "Invalid resource type"
-        
-        cursor.execute(update_query, (resource_id,))
-        
-        # If all resources are NULL after update, delete the row
-        cursor.execute(
-            "SELECT notes_link, ppt_link, pyq_link FROM resources WHERE id = ?",
-            (resource_id,)
-        )
-        updated = cursor.fetchone()
-        
-        if updated and updated[0] is None and updated[1] is None and updated[2] is None:
-            cursor.execute("DELETE FROM resources WHERE id = ?", (resource_id,))
+        conn = _get_conn()
+        with conn:
+            # Check if the entry exists
+            existing = conn.execute(
+                "SELECT id, notes_link, ppt_link, pyq_link FROM resources WHERE subject_code = ? AND unit_number = ?",
+                (subject_code.upper(), unit_number)
+            ).fetchone()
+        
+            if not existing:
+                return False, "Resource not found"
+        
+            resource_id, notes_link, ppt_link, pyq_link = existing
+        
+            # Prepare update query based on resource type
+            if resource_type == 'notes':
+                if not notes_link:
+                    return False, "Notes resource not found"
+                update_query = "UPDATE resources SET notes_link = NULL WHERE id = ?"
+            elif resource_type == 'ppt':
+                if not ppt_link:
+                    return False, "PPT resource not found"
+                update_query = "UPDATE resources SET ppt_link = NULL WHERE id = ?"
+            elif resource_type == 'pyq':
+                if not pyq_link:
+                    return False, "PYQ resource not found"
+                update_query = "UPDATE resources SET pyq_link = NULL WHERE id = ?"
+            else:
+                return False, "Invalid resource type"
+        
+            conn.execute(update_query, (resource_id,))
+        
+            # If all resources are NULL after update, delete the row
+            row_deleted = conn.execute(
+                """
+                DELETE FROM resources
+                WHERE id = ? AND notes_link IS NULL AND ppt_link IS NULL AND pyq_link IS NULL
+                """,
+                (resource_id,)
+            ).rowcount
+            
+            # Forget the subject once its last unit is gone
+            subject_emptied = row_deleted and not conn.execute(
+                "SELECT 1 FROM resources WHERE subject_code = ? LIMIT 1",
+                (subject_code.upper(),)
+            ).fetchone()
+            _bump_stats_version(conn)
         
-        conn.commit()
+        _resources_cache.pop(subject_code.upper())
+        _invalidate_stats()
+        if subject_emptied:
+            _discard_known_subject(subject_code.upper())
         return True, "Resource removed successfully"
     except sqlite3.Error as e:
-        logger.error(f"Database error in remove_resource: {e}")
+        logger.error("Database error in remove_resource: %s", e)
         return False, f"Database error: {e}"
-    finally:
-        if conn:
-            conn.close()
 
 def edit_resource(subject_code, unit_number, resource_type, new_link):
     """Edit a specific resource link for a subject and unit."""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Check if the entry exists
-        cursor.execute(
-            "SELECT id, subject_name FROM resources WHERE subject_code = ? AND unit_number = ?",
-            (subject_code.upper(), unit_number)
-        )
-        
-        existing = cursor.fetchone()
-        
-        if not existing:
-            return False, "Resource not found"
-        
-        resource_id, subject_name = existing
-        
-        # Prepare update query based on resource type
-        if resource_type == 'notes':
-            update_query = "UPDATE resources SET notes_link = ? WHERE id = ?"
-        elif resource_type == 'ppt':
-            update_query = "UPDATE resources SET ppt_link = ? WHERE id = ?"
-        elif resource_type == 'pyq':
-            update_query = "UPDATE resources SET pyq_link = ? WHERE id = ?"
-        else:
-            return False, "Invalid resource type"
-        
-        cursor.execute(update_query, (new_link, resource_id))
-        conn.commit()
-        
+        conn = _get_conn()
+        with conn:
+            # Check if the entry exists
+            existing = conn.execute(
+                "SELECT id, subject_name FROM resources WHERE subject_code = ? AND unit_number = ?",
+                (subject_code.upper(), unit_number)
+            ).fetchone()
+        
+            if not existing:
+                return False, "Resource not found"
+        
+            resource_id, subject_name = existing
+        
+            # Prepare update query based on resource type
+            if resource_type == 'notes':
+                update_query = "UPDATE resources SET notes_link = ? WHERE id = ?"
+            elif resource_type == 'ppt':
+                update_query = "UPDATE resources SET ppt_link = ? WHERE id = ?"
+            elif resource_type == 'pyq':
+                update_query = "UPDATE resources SET pyq_link = ? WHERE id = ?"
+            else:
+                return False, "Invalid resource type"
+        
+            conn.execute(update_query, (new_link, resource_id))
+        
+        _resources_cache.pop(subject_code.upper())
         return True, f"Resource updated successfully for {subject_code} Unit {unit_number}"
     except sqlite3.Error as e:
-        logger.error(f"Database error in edit_resource: {e}")
+        logger.error("Database error in edit_resource: %s", e)
         return False, f"Database error: {e}"
-    finally:
-        if conn:
-            conn.close()
 
 def delete_subject(subject_code):
     """Delete all resources for a given subject code."""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Check if the subject exists
-        cursor.execute(
-            "SELECT COUNT(*) FROM resources WHERE subject_code = ?",
-            (subject_code.upper(),)
-        )
-        
-        count = cursor.fetchone()[0]
+        conn = _get_conn()
+        with conn:
+            # Check if the subject exists
+            count = conn.execute(
+                "SELECT COUNT(*) FROM resources WHERE subject_code = ?",
+                (subject_code.upper(),)
+            ).fetchone()[0]
         
-        if count == 0:
-            return False, "Subject not found"
+            if count == 0:
+                return False, "Subject not found"
         
-        # Delete all resources for the subject
-        cursor.execute("DELETE FROM resources WHERE subject_code = ?", (subject_code.upper(),))
-        conn.commit()
+            # Delete all resources for the subject
+            conn.execute("DELETE FROM resources WHERE subject_code = ?", (subject_code.upper(),))
+            _bump_stats_version(conn)
         
+        _resources_cache.pop(subject_code.upper())
+        _invalidate_stats()
+        _discard_known_subject(subject_code.upper())
         return True, f"Deleted all resources for {subject_code} ({count} entries removed)"
     except sqlite3.Error as e:
-        logger.error(f"Database error in delete_subject: {e}")
+        logger.error("Database error in delete_subject: %s", e)
         return False, f"Database error: {e}"
-    finally:
-        if conn:
-            conn.close()
 
 def increment_subject_access(subject_code):
-    """Increment the access count for a subject code."""
-    conn = None
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Check if the subject code exists in the tracker
-        cursor.execute(
-            "SELECT access_count FROM subject_access WHERE subject_code = ?",
-            (subject_code.upper(),)
-        )
-        result = cursor.fetchone()
-        
-        if result:
-            # Increment existing subject
-            cursor.execute(
-                "UPDATE subject_access SET access_count = access_count + 1 WHERE subject_code = ?",
-                (subject_code.upper(),)
-            )
-        else:
-            # Add new subject entry
-            cursor.execute(
-                "INSERT INTO subject_access (subject_code, access_count) VALUES (?, 1)",
-                (subject_code.upper(),)
-            )
-        
-        conn.commit()
-        return True
-    except sqlite3.Error as e:
-        logger.error(f"Database error in increment_subject_access: {e}")
-        return False
-    finally:
-        if conn:
-            conn.close()
+    """Increment the access count for a subject code (buffered until the next flush)."""
+    with _deltas_lock:
+        _access_deltas[subject_code.upper()] += 1
+        flush = len(_search_deltas) + len(_access_deltas) >= COUNTER_FLUSH_MAX_PENDING
+    _start_counter_flusher()
+    if flush:
+        flush_counters()
+    return True
 
 def get_most_accessed_subject():
     """Get the most frequently accessed subject code."""
-    conn = None
+    flush_counters()
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute(
+        conn = _get_conn()
+        result = conn.execute(
             "SELECT subject_code, access_count FROM subject_access ORDER BY access_count DESC LIMIT 1"
-        )
-        result = cursor.fetchone()
+        ).fetchone()
         
         if result:
             return result[0]  # Return just the subject code
         else:
             return None
     except sqlite3.Error as e:
-        logger.error(f"Database error in get_most_accessed_subject: {e}")
+        logger.error("Database error in get_most_accessed_subject: %s", e)
         return None
-    finally:
-        if conn:
-            conn.close()
 
-def get_pending_verification_requests():
-    """Get all pending payment verification requests with user information."""
-    conn = None
+def get_pending_verification_requests(limit=-1, offset=0):
+    """Get pending payment verification requests, newest first.
+    
+    Returns (requests, total): up to ``limit`` requests starting at ``offset``
+    (all of them by default), and the number of pending requests overall.
+    """
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Get all pending payments with user telegram_id and reference_id
-        cursor.execute("""
+        conn = _get_conn()
+        total = conn.execute(SQL_COUNT_PENDING_PAYMENTS).fetchone()[0]
+        rows = conn.execute("""
             SELECT p.telegram_id, p.reference_id, p.request_time 
             FROM pending_payments p 
             WHERE p.status = 'pending' 
             ORDER BY p.request_time DESC
-        """)
-        
-        pending_requests = []
-        for row in cursor.fetchall():
-            pending_requests.append({
-                "telegram_id": row[0],
-                "reference_id": row[1],
-                "request_time": row[2]
-            })
-        
-        return pending_requests
+            LIMIT ? OFFSET ?
+        """, (limit, offset)).fetchall()
+        
+        pending_requests = [
+            {"telegram_id": telegram_id, "reference_id": reference_id, "request_time": request_time}
+            for telegram_id, reference_id, request_time in rows
+        ]
+        return pending_requests, total
     except sqlite3.Error as e:
-        logger.error(f"Database error in get_pending_verification_requests: {e}")
-        return []
-    finally:
-        if conn:
-            conn.close()
+        logger.error("Database error in get_pending_verification_requests: %s", e)
+        return [], 0
+
+def count_pending_verification_requests():
+    """Get the number of pending payment verification requests."""
+    try:
+        conn = _get_conn()
+        return conn.execute(SQL_COUNT_PENDING_PAYMENTS).fetchone()[0]
+    except sqlite3.Error as e:
+        logger.error("Database error in count_pending_verification_requests: %s", e)
+        return 0
+
+def get_admin_dashboard_payload():
+    """Get the admin panel's stats and pending payment count in one call.
+    
+    Returns a dict with "stats" (as from get_cached_user_stats, or None on
+    failure) and "pending_total" (the number of pending requests).
+    """
+    return {
+        "stats": get_cached_user_stats(),
+        "pending_total": count_pending_verification_requests()
+    }
+
+def get_cached_user_stats():
+    """Get user stats, reusing a recent snapshot.
+    
+    Looks in this process's cache (STATS_CACHE_TTL), then in the snapshot shared
+    through the database (STATS_SNAPSHOT_TTL, same stats_version only), and only
+    then recomputes. Only the bot process stores what it recomputes as the new
+    snapshot.
+    """
+    stats = _stats_cache.get("stats")
+    if stats is not None:
+        return stats
+    
+    version, stats = _read_stats_snapshot()
+    if stats is None:
+        computed_at = int(time.time())
+        stats = get_user_stats()
+        if not stats:
+            return stats
+        if _stats_snapshot_writer and version is not None:
+            _write_stats_snapshot(stats, version, computed_at)
+    _stats_cache.set("stats", stats)
+    return stats
+
+def _read_stats_snapshot():
+    """Return (current stats_version, snapshot), with None for a stale or missing snapshot.
+    
+    The version is read before any recompute, so a snapshot stored from that
+    recompute is already stale if a write commits meanwhile.
+    """
+    try:
+        conn = _get_conn()
+        row = conn.execute(
+            """
+            SELECT v.version, s.value FROM stats_version v
+            LEFT JOIN stats_snapshot s
+                ON s.key = 'user_stats' AND s.version = v.version AND s.updated_at > ?
+            WHERE v.id = 1
+            """,
+            (int(time.time()) - STATS_SNAPSHOT_TTL,)
+        ).fetchone()
+        if row is None:
+            return None, None
+        version, value = row
+        return version, json.loads(value) if value is not None else None
+    except sqlite3.Error as e:
+        logger.error("Database error in _read_stats_snapshot: %s", e)
+        return None, None
+
+def _write_stats_snapshot(stats, version, computed_at):
+    """Store freshly computed stats as the shared snapshot.
+    
+    version is the stats_version the computation started from and computed_at
+    when it started; a slow computation does not overwrite a newer snapshot.
+    """
+    try:
+        conn = _get_conn()
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO stats_snapshot (key, value, updated_at, version) VALUES ('user_stats', ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value, updated_at = excluded.updated_at, version = excluded.version
+                WHERE excluded.version > stats_snapshot.version
+                    OR (excluded.version = stats_snapshot.version
+                        AND excluded.updated_at >= stats_snapshot.updated_at)
+                """,
+                (json.dumps(stats), computed_at, version)
+            )
+    except sqlite3.Error as e:
+        logger.error("Database error in _write_stats_snapshot: %s", e)
+
+def _bump_stats_version(conn):
+    """Mark every stats snapshot stale; call inside the transaction of a write that changes them."""
+    conn.execute("UPDATE stats_version SET version = version + 1 WHERE id = 1")
+
+def _invalidate_stats():
+    """Drop this process's cached stats after a write that changes them has committed."""
+    _stats_cache.clear()
 
 def get_user_stats():
     """Get statistics about users and payments."""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Total users
-        cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = cursor.fetchone()[0]
-        
-        # Active subscribers
-        cursor.execute(
-            "SELECT COUNT(*) FROM users WHERE is_paid = 1 AND datetime(expiry_date) > datetime('now')"
-        )
-        active_subscribers = cursor.fetchone()[0]
-        
-        # Total verified payments
-        cursor.execute("SELECT COUNT(*) FROM pending_payments WHERE status = 'verified'")
-        total_payments = cursor.fetchone()[0]
-        
-        # Pending payments
-        cursor.execute("SELECT COUNT(*) FROM pending_payments WHERE status = 'pending'")
-        pending_payments = cursor.fetchone()[0]
-        
-        # Total resources
-        cursor.execute("SELECT COUNT(*) FROM resources")
-        total_resources = cursor.fetchone()[0]
-        
-        # Subject count
-        cursor.execute("SELECT COUNT(DISTINCT subject_code) FROM resources")
-        subject_count = cursor.fetchone()[0]
+        conn = _get_conn()
+        # Gather every counter in a single statement
+        (total_users, active_subscribers, total_payments,
+         pending_payments, total_resources, subject_count) = conn.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM users),
+                (SELECT COUNT(*) FROM users WHERE is_paid = 1 AND expiry_ts > CAST(strftime('%s', 'now') AS INTEGER)),
+                (SELECT COUNT(*) FROM pending_payments WHERE status = 'verified'),
+                (SELECT COUNT(*) FROM pending_payments WHERE status = 'pending'),
+                (SELECT COUNT(*) FROM resources),
+                (SELECT COUNT(DISTINCT subject_code) FROM resources)
+        """).fetchone()
         
         # Most accessed subject
         most_accessed_subject = get_most_accessed_subject()
@@ -690,8 +1110,5 @@ def get_user_stats():
             "most_accessed_subject": most_accessed_subject
         }
     except sqlite3.Error as e:
-        logger.error(f"Database error in get_user_stats: {e}")
+        logger.error("Database error in get_user_stats: %s", e)
         return None
-    finally:
-        if conn:
-            conn.close()
@@ -1,61 +1,52 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify
 import os
-from database import get_user_stats, DB_PATH
+from database import get_cached_user_stats, DB_PATH
 
 app = Flask(__name__)
 
-@app.route('/')
-def index():
-    """Index page showing bot status"""
-    # Get the bot stats
-    stats = get_user_stats()
-    
-    if not stats:
-        return "Educational Resources Bot - Unable to fetch stats", 500
-    
-    # Return a very simple HTML page
-    return f"""<!DOCTYPE html>
+# Static parts of the status page, encoded once at import
+_HTML_HEAD_BYTES = """<!DOCTYPE html>
     <html lang="en">
     <head>
         <meta charset="UTF-8">
         <title>Bot Status</title>
         <style>
-            body {{
+            body {
                 font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
                 background-color: #f4f4f4;
                 color: #333;
                 margin: 0;
                 padding: 20px;
-            }}
-            .container {{
+            }
+            .container {
                 max-width: 800px;
                 margin: auto;
                 background: white;
                 padding: 30px;
                 border-radius: 10px;
                 box-shadow: 0 0 10px rgba(0,0,0,0.1);
-            }}
-            h1 {{
+            }
+            h1 {
                 color: #2c3e50;
-            }}
-            ul {{
+            }
+            ul {
                 list-style: none;
                 padding-left: 0;
-            }}
-            ul li {{
+            }
+            ul li {
                 margin-bottom: 10px;
                 background: #ecf0f1;
                 padding: 10px;
                 border-radius: 5px;
-            }}
-            code {{
+            }
+            code {
                 background: #dfe6e9;
                 padding: 2px 6px;
                 border-radius: 4px;
-            }}
-            .section {{
+            }
+            .section {
                 margin-top: 30px;
-            }}
+            }
         </style>
     </head>
     <body>
@@ -66,13 +57,18 @@ def index():
             <div class="section">
                 <h2>📊 Stats</h2>
                 <ul>
-                    <li><strong>Total Users:</strong> {stats['total_users']}</li>
-                    <li><strong>Active Subscribers:</strong> {stats['active_subscribers']}</li>
-                    <li><strong>Total Payments:</strong> {stats['total_payments']}</li>
-                    <li><strong>Pending Payments:</strong> {stats['pending_payments']}</li>
-                    <li><strong>Total Resources:</strong> {stats['total_resources']}</li>
-                    <li><strong>Subject Count:</strong> {stats['subject_count']}</li>
-                </ul>
+""".encode("utf-8")
+
+# Bound format_map of the stats list template; formats straight from the stats dict
+_render_stats_items = """                    <li><strong>Total Users:</strong> {total_users}</li>
+                    <li><strong>Active Subscribers:</strong> {active_subscribers}</li>
+                    <li><strong>Total Payments:</strong> {total_payments}</li>
+                    <li><strong>Pending Payments:</strong> {pending_payments}</li>
+                    <li><strong>Total Resources:</strong> {total_resources}</li>
+                    <li><strong>Subject Count:</strong> {subject_count}</li>
+""".format_map
+
+_HTML_TAIL_BYTES = """                </ul>
             </div>
 
             <div class="section">
@@ -88,24 +84,42 @@ def index():
             <div class="section">
                 <h2>ℹ️ Bot Information</h2>
                 <ul>
-                    <li><strong>UPI ID:</strong> {os.environ.get('UPI_ID', 'Not set')}</li>
+                    <li><strong>UPI ID:</strong> {upi_id}</li>
                     <li><strong>Free Searches:</strong> 4</li>
                     <li><strong>Subscription:</strong> ₹21 for 1 week</li>
                 </ul>
             </div>
         </div>
     </body>
-    </html>"""
+    </html>""".format(upi_id=os.environ.get('UPI_ID', 'Not set')).encode("utf-8")
+
+_HEALTH_JSON = b'{"status": "ok"}'
+
+@app.route('/')
+def index():
+    """Index page showing bot status"""
+    # Get the bot stats
+    stats = get_cached_user_stats()
+    
+    if not stats:
+        return "Educational Resources Bot - Unable to fetch stats", 500
+    
+    # Only the stats list changes between requests
+    body = _render_stats_items(stats)
+    return Response(
+        _HTML_HEAD_BYTES + body.encode("utf-8") + _HTML_TAIL_BYTES,
+        content_type="text/html; charset=utf-8"
+    )
 
 @app.route('/health')
 def health():
     """Health endpoint for monitoring"""
-    return jsonify({"status": "ok"})
+    return Response(_HEALTH_JSON, content_type="application/json")
 
 @app.route('/stats')
 def stats():
     """API endpoint to get bot stats"""
-    stats = get_user_stats()
+    stats = get_cached_user_stats()
     if not stats:
         return jsonify({"error": "Unable to fetch stats"}), 500
     return jsonify(stats)
\ No newline at end of file
@@ -0,0 +1,20 @@
+"""Gunicorn settings for serving flask_app:app.
+
+Gunicorn picks this file up automatically when started from the project root:
+
+    gunicorn flask_app:app
+"""
+import os
+
+# Listen on the port supplied by the host, defaulting to the usual Flask port
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# A couple of processes with a thread pool each, so health probes and stats
+# scrapes are served concurrently instead of one at a time
+workers = int(os.environ.get("WEB_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", "8"))
+
+# Keep connections from monitoring clients open between requests
+keepalive = 30
+timeout = 30
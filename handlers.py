@@ -1,29 +1,143 @@
 import re
 import os
+import html
+import json
 import logging
-import sqlite3
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import wraps
 from datetime import datetime
 from telegram import Update, ParseMode, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove, CallbackQuery
+from telegram.error import BadRequest, NetworkError, RetryAfter
 from telegram.ext import CallbackContext, CallbackQueryHandler
 from database import (
-    get_user, create_user, increment_search_count, get_search_count,
+    create_user, increment_search_count, get_search_count,
     check_subscription, add_pending_payment, verify_payment, grant_access,
-    add_resource, get_resources, get_user_stats, remove_resource, edit_resource, 
-    delete_subject, DB_PATH, get_subscription_expiry, increment_subject_access,
-    get_pending_verification_requests
+    add_resource, bulk_add_resources, get_resources, get_user_stats, get_cached_user_stats, remove_resource, edit_resource, 
+    delete_subject, increment_subject_access,
+    get_pending_verification_requests, get_admin_dashboard_payload, get_user_state, get_user_history, get_subject_name, is_known_subject
 )
-from utils import format_resource_message, create_loading_messages
+from utils import format_resource_message, build_resource_keyboard, create_loading_messages
 
 logger = logging.getLogger(__name__)
 
 # Constants
 # Try to get ADMIN_ID as integer, but fallback to string comparison if needed
 ADMIN_ID = os.environ.get("ADMIN_ID", "0")
+# Integer form for comparing against user ids; -1 never matches a real user
+try:
+    ADMIN_ID_INT = int(ADMIN_ID)
+except ValueError:
+    ADMIN_ID_INT = -1
 UPI_ID = os.environ.get("UPI_ID", "yourupi@paytm")
 FREE_SEARCHES = 4
 
-# Regular expression for subject codes (e.g., CSE211)
-SUBJECT_CODE_PATTERN = re.compile(r'\b([A-Za-z]{2,3})(\d{3})\b')
+# Regular expression for subject codes (e.g., CSE211); codes are ASCII-only
+SUBJECT_CODE_PATTERN = re.compile(r'\b([A-Za-z]{2,3})(\d{3})\b', re.ASCII)
+
+# Resource links must be http(s) URLs
+_URL_RE = re.compile(r'^https?://')
+_URL_ERR = "Link must start with http:// or https://"
+
+# Shortest text that can hold a subject code, and the digits every code contains;
+# used to skip the regex for messages that cannot match
+MIN_SUBJECT_CODE_LENGTH = 5
+MAX_SUBJECT_CODE_LENGTH = 6
+ASCII_DIGITS = frozenset('0123456789')
+
+# Full-string subject code format accepted when an admin adds a resource
+ADD_SUBJECT_CODE_RE = re.compile(r'^[A-Z]{2,3}\d{3}$', re.ASCII)
+
+# Static /start and /help text, built once; only the fields in braces vary per call
+_START_TEMPLATE = (
+    "👋 Hello {username}!\n\n"
+    "Welcome to your University Resource Bot — your personal academic assistant.  \n"
+    "Simply mention any subject code like *CSE211* in your message, and I'll instantly fetch all available resources including:\n\n"
+    "📚 Notes  \n"
+    "📽️ PPTs  \n"
+    "❓ Previous Year Question Papers (PYQs)\n\n"
+    "🎁 You have *{free_searches} free searches* to explore.  \n"
+    "After that, unlock *unlimited access for 1 week* by paying just ₹21 via UPI.\n\n"
+    "Let's get started! Type your subject code now 👇"
+)
+
+_HELP_TEMPLATE = (
+    "🤖 *Educational Resources Bot Help*\n\n"
+    "*How to use:*\n"
+    "- Simply mention a subject code like *CSE211* in your message\n"
+    "- I'll show you available resources for that subject\n\n"
+    "*User Commands:*\n"
+    "- /start - Start the bot\n"
+    "- /help - Show this help message\n"
+    "- /my_history - Check your usage and subscription status\n"
+    "- /animations - Turn the loading animation on or off\n"
+    "- /verify_payment <ref_id> - Submit payment for verification\n\n"
+    "*Your Status:*\n"
+    "{subscription_status}\n\n"
+    "*Subscription:*\n"
+    "- Price: ₹21 for 1 week of unlimited searches\n"
+    "- Payment: Send ₹21 to *{upi_id}* via UPI\n"
+    "- After payment, use /verify_payment with your UPI reference ID\n"
+    "- Example: `/verify_payment 12345678`"
+)
+
+_HELP_ADMIN_TAIL = (
+    "\n\n*Admin Commands:*\n"
+    "- /admin - Open the Admin Control Panel\n"
+    "- /verify <ref_id> - Verify a user's payment\n"
+    "- /grant_access <telegram_id> - Directly grant subscription access\n"
+    "- /add_resource - Start interactive resource addition flow\n"
+    "- /remove_resource <code> <unit> <type> - Remove a specific resource\n"
+    "- /edit_resource <code> <unit> <type> <new_link> - Update a resource link\n"
+    "- /delete_subject <code> - Delete all resources for a subject\n"
+    "- /upload_json - Bulk upload resources from a JSON file\n"
+    "- /stats - Show bot statistics"
+)
+
+# Frequently sent replies as Telegram HTML; static parts (including the UPI id)
+# are escaped once here and only per-call values are escaped when formatting
+_MSG_PAYMENT_STEPS_HTML = (
+    "- Send ₹21 to <b>{upi_id}</b> via UPI\n"
+    "- After payment, use /verify_payment with your UPI reference ID\n"
+    "- Example: <code>/verify_payment 12345678</code>\n\n"
+    "Your subscription will be active for 1 week after verification."
+).format(upi_id=html.escape(UPI_ID))
+
+_MSG_EXPIRED_HTML = (
+    "⚠️ <b>Your subscription has expired</b>\n\n"
+    "To continue accessing resources, please renew your subscription:\n"
+) + _MSG_PAYMENT_STEPS_HTML
+
+_MSG_FREE_USED_HTML = (
+    "⚠️ <b>You've used all your free searches</b>\n\n"
+    "To continue accessing resources, please subscribe:\n"
+) + _MSG_PAYMENT_STEPS_HTML
+
+_MSG_NO_RESOURCES_HTML = "⚠️ No resources found for subject code: <b>{subject_code}</b>"
+
+_MSG_PAYMENT_ACK_HTML = (
+    "✅ Payment reference <b>{reference_id}</b> received!\n\n"
+    "Your payment will be verified by an admin shortly. "
+    "You'll receive a notification once it's confirmed."
+)
+
+# Markdown replies sent once a payment has been verified, by /verify or the admin panel
+_MSG_PAYMENT_VERIFIED_ADMIN = "✅ Payment with reference ID *{reference_id}* has been verified successfully!"
+_MSG_PAYMENT_VERIFIED_USER = (
+    "🎉 Your payment with reference ID *{reference_id}* has been verified!\n\n"
+    "Your subscription is now active for 1 week. Enjoy unlimited searches!"
+)
+
+def admin_only(handler):
+    """Decorate a command handler so only the admin can run it; others get a refusal."""
+    @wraps(handler)
+    def wrapper(update: Update, context: CallbackContext, *args, **kwargs):
+        if update.effective_user.id != ADMIN_ID_INT:
+            update.message.reply_text("⚠️ This command is for administrators only.")
+            return
+        return handler(update, context, *args, **kwargs)
+    return wrapper
 
 def start_handler(update: Update, context: CallbackContext):
     """Handle the /start command."""
@@ -31,21 +145,10 @@ def start_handler(update: Update, context: CallbackContext):
     telegram_id = user.id
     username = user.username or user.first_name
     
-    # Create user if not exists
-    if not get_user(telegram_id):
-        create_user(telegram_id)
+    # Create user if not exists (a no-op for returning users)
+    create_user(telegram_id)
     
-    message = (
-        f"👋 Hello {username}!\n\n"
-        f"Welcome to your University Resource Bot — your personal academic assistant.  \n"
-        f"Simply mention any subject code like *CSE211* in your message, and I'll instantly fetch all available resources including:\n\n"
-        f"📚 Notes  \n"
-        f"📽️ PPTs  \n"
-        f"❓ Previous Year Question Papers (PYQs)\n\n"
-        f"🎁 You have *{FREE_SEARCHES} free searches* to explore.  \n"
-        f"After that, unlock *unlimited access for 1 week* by paying just ₹21 via UPI.\n\n"
-        f"Let's get started! Type your subject code now 👇"
-    )
+    message = _START_TEMPLATE.format_map({'username': username, 'free_searches': FREE_SEARCHES})
     
     update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
 
@@ -63,40 +166,11 @@ def help_handler(update: Update, context: CallbackContext):
     )
     
     # Basic commands for all users
-    message = (
-        f"🤖 *Educational Resources Bot Help*\n\n"
-        f"*How to use:*\n"
-        f"- Simply mention a subject code like *CSE211* in your message\n"
-        f"- I'll show you available resources for that subject\n\n"
-        f"*User Commands:*\n"
-        f"- /start - Start the bot\n"
-        f"- /help - Show this help message\n"
-        f"- /my_history - Check your usage and subscription status\n"
-        f"- /verify_payment <ref_id> - Submit payment for verification\n\n"
-        f"*Your Status:*\n"
-        f"{subscription_status}\n\n"
-        f"*Subscription:*\n"
-        f"- Price: ₹21 for 1 week of unlimited searches\n"
-        f"- Payment: Send ₹21 to *{UPI_ID}* via UPI\n"
-        f"- After payment, use /verify_payment with your UPI reference ID\n"
-        f"- Example: `/verify_payment 12345678`"
-    )
+    message = _HELP_TEMPLATE.format_map({'subscription_status': subscription_status, 'upi_id': UPI_ID})
     
     # Add admin commands if this is an admin
-    if str(telegram_id) == ADMIN_ID:
-        admin_commands = (
-            f"\n\n*Admin Commands:*\n"
-            f"- /admin - Open the Admin Control Panel\n"
-            f"- /verify <ref_id> - Verify a user's payment\n"
-            f"- /grant_access <telegram_id> - Directly grant subscription access\n"
-            f"- /add_resource - Start interactive resource addition flow\n"
-            f"- /remove_resource <code> <unit> <type> - Remove a specific resource\n"
-            f"- /edit_resource <code> <unit> <type> <new_link> - Update a resource link\n"
-            f"- /delete_subject <code> - Delete all resources for a subject\n"
-            f"- /upload_json - Bulk upload resources from a JSON file\n"
-            f"- /stats - Show bot statistics"
-        )
-        message += admin_commands
+    if telegram_id == ADMIN_ID_INT:
+        message += _HELP_ADMIN_TAIL
     
     update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
 
@@ -106,7 +180,7 @@ def message_handler(update: Update, context: CallbackContext):
     telegram_id = update.effective_user.id
     
     # Check if this is a response to a pending subject name request (for admin)
-    if str(telegram_id) == ADMIN_ID and 'pending_resource' in context.user_data:
+    if telegram_id == ADMIN_ID_INT and 'pending_resource' in context.user_data:
         # Admin is providing a subject name for a new resource
         subject_name = message_text.strip()
         pending = context.user_data['pending_resource']
@@ -143,87 +217,75 @@ def message_handler(update: Update, context: CallbackContext):
         update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
         return
         
-    # Check if this is a response to delete subject confirmation (for admin)
-    if str(telegram_id) == ADMIN_ID and 'delete_subject' in context.user_data:
-        # Process delete subject confirmation
-        process_delete_subject_confirmation(update, context)
+    # If not handling admin input, check for subject code; messages that are too
+    # short or have no digits cannot contain one
+    if len(message_text) < MIN_SUBJECT_CODE_LENGTH or ASCII_DIGITS.isdisjoint(message_text):
         return
     
-    # If not handling admin input, check for subject code
-    match = SUBJECT_CODE_PATTERN.search(message_text)
+    # Most messages are just the code itself, which can be checked by slicing;
+    # anything else goes through the full pattern
+    candidate = message_text.strip()
+    if (MIN_SUBJECT_CODE_LENGTH <= len(candidate) <= MAX_SUBJECT_CODE_LENGTH
+            and candidate.isascii()
+            and candidate[:-3].isalpha()
+            and candidate[-3:].isdigit()):
+        subject_code = candidate.upper()
+    else:
+        match = SUBJECT_CODE_PATTERN.search(message_text)
+        
+        if not match:
+            return
+        
+        subject_code = match.group(0).upper()
     
-    if not match:
+    # Codes with no resources at all are answered without touching the database
+    if not is_known_subject(subject_code):
+        update.message.reply_text(
+            _MSG_NO_RESOURCES_HTML.format_map({'subject_code': subject_code}),
+            parse_mode=ParseMode.HTML
+        )
         return
     
-    subject_code = match.group(0).upper()
-    
-    # Create user if not exists
-    if not get_user(telegram_id):
-        create_user(telegram_id)
-    
-    # Check if user has an active subscription
-    # The check_subscription function will automatically reset is_paid to 0 if subscription has expired
-    is_subscribed = check_subscription(telegram_id)
-    
-    # Check if user has used all free searches
-    searches_used = get_search_count(telegram_id)
+    # Load subscription status and search usage in one query (creates the user if needed)
+    user_state = get_user_state(telegram_id)
+    is_subscribed = user_state.is_subscribed
+    searches_used = user_state.search_count
     
     # Check user subscription status
     if not is_subscribed:
-        # If user has a row in pending_payments with status='verified', it means
-        # their subscription has expired rather than never having subscribed
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT COUNT(*) FROM pending_payments WHERE telegram_id = ? AND status = 'verified'",
-            (telegram_id,)
-        )
-        payment_count = cursor.fetchone()[0]
-        conn.close()
-        
-        had_subscription = payment_count > 0
-        
         # If they've used all free searches, show payment prompt
         if searches_used >= FREE_SEARCHES:
-            if had_subscription:
+            # A verified payment on record means their subscription has expired
+            # rather than never having subscribed
+            if user_state.had_prior_subscription:
                 # Subscription expired message
-                message = (
-                    f"⚠️ *Your subscription has expired*\n\n"
-                    f"To continue accessing resources, please renew your subscription:\n"
-                    f"- Send ₹21 to *{UPI_ID}* via UPI\n"
-                    f"- After payment, use /verify_payment with your UPI reference ID\n"
-                    f"- Example: `/verify_payment 12345678`\n\n"
-                    f"Your subscription will be active for 1 week after verification."
-                )
+                message = _MSG_EXPIRED_HTML
             else:
                 # Free searches used up message
-                message = (
-                    f"⚠️ *You've used all your free searches*\n\n"
-                    f"To continue accessing resources, please subscribe:\n"
-                    f"- Send ₹21 to *{UPI_ID}* via UPI\n"
-                    f"- After payment, use /verify_payment with your UPI reference ID\n"
-                    f"- Example: `/verify_payment 12345678`\n\n"
-                    f"Your subscription will be active for 1 week after verification."
-                )
-            update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+                message = _MSG_FREE_USED_HTML
+            update.message.reply_text(message, parse_mode=ParseMode.HTML)
             return
     
     # Get resources for the subject code
     subject_name, resources = get_resources(subject_code)
     
     if not subject_name or not resources:
-        update.message.reply_text(f"⚠️ No resources found for subject code: *{subject_code}*", parse_mode=ParseMode.MARKDOWN)
+        update.message.reply_text(
+            _MSG_NO_RESOURCES_HTML.format_map({'subject_code': subject_code}),
+            parse_mode=ParseMode.HTML
+        )
         return
         
     # Track subject access (only if resources found)
     increment_subject_access(subject_code)
     
     # Format the response message
-    message, reply_markup = format_resource_message(subject_code, subject_name, resources, searches_used, is_subscribed, UPI_ID)
+    message, buttons = format_resource_message(subject_code, subject_name, resources, searches_used, is_subscribed, UPI_ID)
     
-    # Increment search count if not subscribed
+    # Increment search count if not subscribed; the search that uses up the free
+    # quota is written straight away rather than left in the buffer
     if not is_subscribed:
-        increment_search_count(telegram_id)
+        increment_search_count(telegram_id, flush=searches_used + 1 >= FREE_SEARCHES)
     
     # Get the loading message sequence
     loading_messages = create_loading_messages(subject_code)
@@ -231,26 +293,36 @@ def message_handler(update: Update, context: CallbackContext):
     # Send the first loading message
     loading_msg = update.message.reply_text(loading_messages[0], parse_mode=ParseMode.MARKDOWN)
     
-    # Store the data needed for the animation sequence
-    context.user_data['edit_message_data'] = {
-        'chat_id': update.effective_chat.id,
-        'message_id': loading_msg.message_id,
-        'loading_messages': loading_messages,
-        'current_index': 0,
-        'final_message': message,
-        'reply_markup': reply_markup
-    }
-    
-    # Show typing indicator for additional effect
-    context.bot.send_chat_action(chat_id=telegram_id, action="typing")
+    # Every animation frame is another Telegram API call, so the full sequence is
+    # opt-in (/animations); by default the loading message is replaced by the
+    # resources in one edit
+    if not context.user_data.get('animations_enabled'):
+        loading_messages = loading_messages[:1]
+    
+    # The data needed for the animation sequence travels with the job
+    anim_state = AnimState(
+        chat_id=update.effective_chat.id,
+        message_id=loading_msg.message_id,
+        loading_messages=loading_messages,
+        current_index=0,
+        final_message=message,
+        buttons=buttons
+    )
     
-    # Schedule the first animation update after a short delay (0.3 seconds)
+    # Schedule the first animation update (or the final edit) after a short delay (0.3 seconds)
     context.job_queue.run_once(
         animate_resource_loading, 
         0.3, 
-        context=context.user_data['edit_message_data']
+        context=anim_state
     )
 
+def text_handler(update: Update, context: CallbackContext):
+    """Route plain text to the resource addition conversation or to subject code lookup."""
+    if 'conversation_state' in context.user_data:
+        process_resource_conversation(update, context)
+    else:
+        message_handler(update, context)
+
 def verify_payment_handler(update: Update, context: CallbackContext):
     """Handle the /verify_payment command."""
     telegram_id = update.effective_user.id
@@ -268,43 +340,87 @@ def verify_payment_handler(update: Update, context: CallbackContext):
     
     # Add pending payment
     if add_pending_payment(telegram_id, reference_id):
-        message = (
-            f"✅ Payment reference *{reference_id}* received!\n\n"
-            f"Your payment will be verified by an admin shortly. "
-            f"You'll receive a notification once it's confirmed."
-        )
+        message = _MSG_PAYMENT_ACK_HTML.format_map({'reference_id': html.escape(reference_id)})
         
-        # Notify admin about the new payment verification request
-        admin_message = (
-            f"🔔 *New Payment Verification Request*\n\n"
-            f"- User ID: `{telegram_id}`\n"
-            f"- Username: @{update.effective_user.username or 'N/A'}\n"
-            f"- Reference ID: `{reference_id}`\n\n"
-            f"To verify: `/verify {reference_id}`"
-        )
+        # Queue the admin notification; flush_admin_notifications sends it in a batch
+        _admin_notify_q.put((telegram_id, update.effective_user.username or 'N/A', reference_id))
+    else:
+        message = "⚠️ Failed to process your payment verification request. Please try again or contact support."
+    
+    update.message.reply_text(message, parse_mode=ParseMode.HTML)
+
+# Pending payment notifications for the admin, sent in batches by a repeating job
+_admin_notify_q = queue.Queue()
+
+# Requests per admin message, which keeps each batch well under Telegram's length limit
+ADMIN_NOTIFY_BATCH_SIZE = 20
+
+# Telegram HTML for the batched admin notifications; the fields are escaped
+_ADMIN_NOTIFY_ONE_HTML = (
+    "🔔 <b>New Payment Verification Request</b>\n\n"
+    "- User ID: <code>{telegram_id}</code>\n"
+    "- Username: @{username}\n"
+    "- Reference ID: <code>{reference_id}</code>\n\n"
+    "To verify: <code>/verify {reference_id}</code>"
+)
+_ADMIN_NOTIFY_MANY_HTML = "🔔 <b>{count} New Payment Verification Requests</b>\n"
+_ADMIN_NOTIFY_LINE_HTML = (
+    "- User <code>{telegram_id}</code> (@{username}), ref <code>{reference_id}</code>: "
+    "<code>/verify {reference_id}</code>"
+)
+
+def _admin_notification_values(telegram_id, username, reference_id):
+    """Escape one queued request's fields for the admin notification templates."""
+    return {
+        'telegram_id': telegram_id,
+        'username': html.escape(username),
+        'reference_id': html.escape(reference_id),
+    }
+
+def _format_admin_notification(batch):
+    """Build one admin message for a batch of (telegram_id, username, reference_id) requests."""
+    if len(batch) == 1:
+        return _ADMIN_NOTIFY_ONE_HTML.format_map(_admin_notification_values(*batch[0]))
+    
+    lines = [_ADMIN_NOTIFY_MANY_HTML.format(count=len(batch))]
+    for item in batch:
+        lines.append(_ADMIN_NOTIFY_LINE_HTML.format_map(_admin_notification_values(*item)))
+    return "\n".join(lines)
+
+def flush_admin_notifications(context: CallbackContext):
+    """Job callback that sends queued payment verification requests to the admin."""
+    while True:
+        batch = []
+        while len(batch) < ADMIN_NOTIFY_BATCH_SIZE:
+            try:
+                batch.append(_admin_notify_q.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return
         
         try:
             context.bot.send_message(
                 chat_id=ADMIN_ID,
-                text=admin_message,
-                parse_mode=ParseMode.MARKDOWN
+                text=_format_admin_notification(batch),
+                parse_mode=ParseMode.HTML
             )
+        except BadRequest as e:
+            # Retrying can't fix a rejected message or an unknown admin chat
+            # (BadRequest must be caught before its base class NetworkError)
+            logger.error("Dropping %d admin notifications: %s", len(batch), e)
+        except (NetworkError, RetryAfter) as e:
+            logger.error("Failed to notify admin, will retry: %s", e)
+            # Put the batch back so the next run retries it
+            for item in batch:
+                _admin_notify_q.put(item)
+            return
         except Exception as e:
-            logger.error(f"Failed to notify admin: {e}")
-    else:
-        message = "⚠️ Failed to process your payment verification request. Please try again or contact support."
-    
-    update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+            logger.error("Dropping %d admin notifications: %s", len(batch), e)
 
+@admin_only
 def admin_verify_payment_handler(update: Update, context: CallbackContext):
     """Handle the /verify command (admin only)."""
-    telegram_id = update.effective_user.id
-    
-    # Check if the user is an admin
-    if str(telegram_id) != ADMIN_ID:
-        update.message.reply_text("⚠️ This command is for administrators only.")
-        return
-    
     # Check if reference ID is provided
     if not context.args or len(context.args) < 1:
         update.message.reply_text("⚠️ Please provide the UPI reference ID to verify.")
@@ -317,14 +433,11 @@ def admin_verify_payment_handler(update: Update, context: CallbackContext):
     
     if verified_telegram_id:
         # Notify the admin
-        admin_message = f"✅ Payment with reference ID *{reference_id}* has been verified successfully!"
+        admin_message = _MSG_PAYMENT_VERIFIED_ADMIN.format(reference_id=reference_id)
         update.message.reply_text(admin_message, parse_mode=ParseMode.MARKDOWN)
         
         # Notify the user
-        user_message = (
-            f"🎉 Your payment with reference ID *{reference_id}* has been verified!\n\n"
-            f"Your subscription is now active for 1 week. Enjoy unlimited searches!"
-        )
+        user_message = _MSG_PAYMENT_VERIFIED_USER.format(reference_id=reference_id)
         
         try:
             context.bot.send_message(
@@ -337,19 +450,18 @@ def admin_verify_payment_handler(update: Update, context: CallbackContext):
     else:
         update.message.reply_text(f"⚠️ Failed to verify payment with reference ID *{reference_id}*.", parse_mode=ParseMode.MARKDOWN)
 
+# Reply keyboards are immutable, so each one is built once and reused
+_RESOURCE_TYPE_KB = ReplyKeyboardMarkup([["notes", "ppt", "pyq"]], one_time_keyboard=True, resize_keyboard=True)
+_CONFIRM_KB = ReplyKeyboardMarkup([["✅ Confirm", "❌ Cancel"]], one_time_keyboard=True, resize_keyboard=True)
+_REMOVE_KB = ReplyKeyboardRemove()
+
 # Resource addition conversation states
 # Used for the step-by-step resource addition flow
 ADD_SUBJECT_CODE, ADD_SUBJECT_NAME, ADD_UNIT_NUMBER, ADD_RESOURCE_TYPE, ADD_RESOURCE_LINK, ADD_CONFIRMATION = range(6)
 
+@admin_only
 def add_resource_handler(update: Update, context: CallbackContext):
     """Handle the /add_resource command (admin only) with a step-by-step conversation flow."""
-    telegram_id = update.effective_user.id
-    
-    # Check if the user is an admin
-    if str(telegram_id) != ADMIN_ID:
-        update.message.reply_text("⚠️ This command is for administrators only.")
-        return
-    
     # Check if there are any arguments - we'll ignore them in this new flow
     if context.args:
         update.message.reply_text(
@@ -371,270 +483,270 @@ def add_resource_handler(update: Update, context: CallbackContext):
     )
     return
 
-def process_resource_conversation(update: Update, context: CallbackContext):
-    """Process each step of the resource addition conversation."""
-    telegram_id = update.effective_user.id
-    message_text = update.message.text.strip()
+def _handle_subject_code(update: Update, context: CallbackContext, resource_data, message_text):
+    """Validate the subject code and look up whether the subject already exists."""
+    # Process subject code
+    subject_code = message_text.upper()
     
-    # Only admin can use this conversation
-    if str(telegram_id) != ADMIN_ID:
-        return
-    
-    # Check if we're in a resource addition conversation
-    if 'conversation_state' not in context.user_data:
+    # Validate subject code format (2-3 letters followed by 3 digits)
+    if not ADD_SUBJECT_CODE_RE.match(subject_code):
+        update.message.reply_text(
+            "⚠️ Invalid subject code format. Please enter a valid code like CSE211:",
+            parse_mode=ParseMode.MARKDOWN
+        )
         return
     
-    state = context.user_data['conversation_state']
-    resource_data = context.user_data.get('add_resource', {})
+    # Store subject code
+    resource_data['subject_code'] = subject_code
+    context.user_data['add_resource'] = resource_data
     
-    # Process based on current state
-    if state == ADD_SUBJECT_CODE:
-        # Process subject code
-        subject_code = message_text.upper()
-        
-        # Validate subject code format (2-3 letters followed by 3 digits)
-        if not re.match(r'^[A-Z]{2,3}\d{3}$', subject_code):
-            update.message.reply_text(
-                "⚠️ Invalid subject code format. Please enter a valid code like CSE211:",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            return
-        
-        # Store subject code
-        resource_data['subject_code'] = subject_code
-        context.user_data['add_resource'] = resource_data
-        
-        # Check if subject already exists
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT subject_name FROM resources WHERE subject_code = ? LIMIT 1", (subject_code,))
-        existing_subject = cursor.fetchone()
-        conn.close()
-        
-        if existing_subject:
-            # Subject exists, store the name and move to unit number
-            resource_data['subject_name'] = existing_subject['subject_name']
-            context.user_data['conversation_state'] = ADD_UNIT_NUMBER
-            
-            update.message.reply_text(
-                f"📚 *Add New Resource - Step 2/5*\n\n"
-                f"Subject *{subject_code}: {resource_data['subject_name']}* found in database.\n\n"
-                f"Please enter the *unit number* (1-6):",
-                parse_mode=ParseMode.MARKDOWN
-            )
-        else:
-            # Subject doesn't exist, ask for subject name
-            context.user_data['conversation_state'] = ADD_SUBJECT_NAME
-            
-            update.message.reply_text(
-                f"🌟 *Add New Resource - Step 2/5*\n\n"
-                f"Subject code *{subject_code}* is not in the database.\n\n"
-                f"Please enter the *full subject name*:",
-                parse_mode=ParseMode.MARKDOWN
-            )
+    # Check if subject already exists
+    existing_subject_name = get_subject_name(subject_code)
     
-    elif state == ADD_SUBJECT_NAME:
-        # Process subject name
-        subject_name = message_text
-        
-        # Validate subject name length
-        if len(subject_name) < 3 or len(subject_name) > 100:
-            update.message.reply_text(
-                "⚠️ Subject name is too short or too long. Please enter a valid name (3-100 characters):",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            return
-        
-        # Store subject name
-        resource_data['subject_name'] = subject_name
-        context.user_data['add_resource'] = resource_data
+    if existing_subject_name:
+        # Subject exists, store the name and move to unit number
+        resource_data['subject_name'] = existing_subject_name
         context.user_data['conversation_state'] = ADD_UNIT_NUMBER
-        
+    
         update.message.reply_text(
-            f"📚 *Add New Resource - Step 3/5*\n\n"
-            f"Subject name: *{subject_name}*\n\n"
+            f"📚 *Add New Resource - Step 2/5*\n\n"
+            f"Subject *{subject_code}: {resource_data['subject_name']}* found in database.\n\n"
             f"Please enter the *unit number* (1-6):",
             parse_mode=ParseMode.MARKDOWN
         )
+    else:
+        # Subject doesn't exist, ask for subject name
+        context.user_data['conversation_state'] = ADD_SUBJECT_NAME
     
-    elif state == ADD_UNIT_NUMBER:
-        # Process unit number
-        try:
-            unit_number = int(message_text)
-            
-            # Validate unit number range
-            if unit_number < 1 or unit_number > 6:
-                update.message.reply_text(
-                    "⚠️ Unit number must be between 1 and 6. Please enter a valid unit number:",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                return
-            
-            # Store unit number
-            resource_data['unit_number'] = unit_number
-            context.user_data['add_resource'] = resource_data
-            context.user_data['conversation_state'] = ADD_RESOURCE_TYPE
-            
-            # Create a keyboard for resource type selection
-            keyboard = [
-                ["notes", "ppt", "pyq"]
-            ]
-            reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-            
-            update.message.reply_text(
-                f"📚 *Add New Resource - Step 4/5*\n\n"
-                f"Unit number: *{unit_number}*\n\n"
-                f"Please select the *resource type* (notes, ppt, pyq):",
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=reply_markup
-            )
-        except ValueError:
-            update.message.reply_text(
-                "⚠️ Please enter a valid number for the unit (1-6):",
-                parse_mode=ParseMode.MARKDOWN
-            )
+        update.message.reply_text(
+            f"🌟 *Add New Resource - Step 2/5*\n\n"
+            f"Subject code *{subject_code}* is not in the database.\n\n"
+            f"Please enter the *full subject name*:",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+def _handle_subject_name(update: Update, context: CallbackContext, resource_data, message_text):
+    """Store the name for a new subject."""
+    # Process subject name
+    subject_name = message_text
     
-    elif state == ADD_RESOURCE_TYPE:
-        # Process resource type
-        resource_type = message_text.lower()
-        
-        # Validate resource type
-        if resource_type not in ['notes', 'ppt', 'pyq']:
-            # Create a keyboard for resource type selection for retry
-            keyboard = [
-                ["notes", "ppt", "pyq"]
-            ]
-            reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-            
+    # Validate subject name length
+    if len(subject_name) < 3 or len(subject_name) > 100:
+        update.message.reply_text(
+            "⚠️ Subject name is too short or too long. Please enter a valid name (3-100 characters):",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    
+    # Store subject name
+    resource_data['subject_name'] = subject_name
+    context.user_data['add_resource'] = resource_data
+    context.user_data['conversation_state'] = ADD_UNIT_NUMBER
+    
+    update.message.reply_text(
+        f"📚 *Add New Resource - Step 3/5*\n\n"
+        f"Subject name: *{subject_name}*\n\n"
+        f"Please enter the *unit number* (1-6):",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+def _handle_unit_number(update: Update, context: CallbackContext, resource_data, message_text):
+    """Store the unit number and offer the resource types."""
+    # Process unit number
+    try:
+        unit_number = int(message_text)
+    
+        # Validate unit number range
+        if unit_number < 1 or unit_number > 6:
             update.message.reply_text(
-                "⚠️ Invalid resource type. Please select one of: notes, ppt, or pyq:",
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=reply_markup
+                "⚠️ Unit number must be between 1 and 6. Please enter a valid unit number:",
+                parse_mode=ParseMode.MARKDOWN
             )
             return
-        
-        # Store resource type
-        resource_data['resource_type'] = resource_type
+    
+        # Store unit number
+        resource_data['unit_number'] = unit_number
         context.user_data['add_resource'] = resource_data
-        context.user_data['conversation_state'] = ADD_RESOURCE_LINK
-        
-        # Remove custom keyboard
-        reply_markup = ReplyKeyboardRemove()
-        
+        context.user_data['conversation_state'] = ADD_RESOURCE_TYPE
+    
+        # Create a keyboard for resource type selection
+        reply_markup = _RESOURCE_TYPE_KB
+    
         update.message.reply_text(
-            f"📚 *Add New Resource - Step 5/5*\n\n"
-            f"Resource type: *{resource_type}*\n\n"
-            f"Please enter the resource *link* (must start with http:// or https://):",
+            f"📚 *Add New Resource - Step 4/5*\n\n"
+            f"Unit number: *{unit_number}*\n\n"
+            f"Please select the *resource type* (notes, ppt, pyq):",
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=reply_markup
         )
+    except ValueError:
+        update.message.reply_text(
+            "⚠️ Please enter a valid number for the unit (1-6):",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+def _handle_resource_type(update: Update, context: CallbackContext, resource_data, message_text):
+    """Store the resource type and ask for the link."""
+    # Process resource type
+    resource_type = message_text.lower()
+    
+    # Validate resource type
+    if resource_type not in ['notes', 'ppt', 'pyq']:
+        # Create a keyboard for resource type selection for retry
+        reply_markup = _RESOURCE_TYPE_KB
     
-    elif state == ADD_RESOURCE_LINK:
-        # Process resource link
-        link = message_text.strip()
-        
-        # Validate link format
-        if not link.startswith('http'):
-            update.message.reply_text(
-                "⚠️ Link must start with http:// or https://. Please enter a valid link:",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            return
-        
-        # Store link
-        resource_data['link'] = link
-        context.user_data['add_resource'] = resource_data
-        context.user_data['conversation_state'] = ADD_CONFIRMATION
-        
-        # Create a confirmation keyboard
-        keyboard = [
-            ["✅ Confirm", "❌ Cancel"]
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        
-        # Show summary for confirmation
         update.message.reply_text(
-            f"📝 *Resource Addition - Confirmation*\n\n"
-            f"Please review the resource details:\n\n"
-            f"- Subject Code: *{resource_data['subject_code']}*\n"
-            f"- Subject Name: *{resource_data['subject_name']}*\n"
-            f"- Unit Number: *{resource_data['unit_number']}*\n"
-            f"- Resource Type: *{resource_data['resource_type']}*\n"
-            f"- Link: {resource_data['link']}\n\n"
-            f"Is this correct?",
+            "⚠️ Invalid resource type. Please select one of: notes, ppt, or pyq:",
             parse_mode=ParseMode.MARKDOWN,
-            reply_markup=reply_markup,
-            disable_web_page_preview=True
+            reply_markup=reply_markup
         )
+        return
     
-    elif state == ADD_CONFIRMATION:
-        # Process confirmation
-        confirmation = message_text.strip().lower()
-        
-        # Remove custom keyboard
-        reply_markup = ReplyKeyboardRemove()
-        
-        if "confirm" in confirmation or "✅" in confirmation:
-            # Add the resource to the database
-            subject_code = resource_data['subject_code']
-            subject_name = resource_data['subject_name']
-            unit_number = resource_data['unit_number']
-            resource_type = resource_data['resource_type']
-            link = resource_data['link']
-            
-            # Prepare kwargs for add_resource
-            kwargs = {
-                'subject_code': subject_code,
-                'subject_name': subject_name,
-                'unit_number': unit_number
-            }
-            
-            if resource_type == 'notes':
-                kwargs['notes_link'] = link
-            elif resource_type == 'ppt':
-                kwargs['ppt_link'] = link
-            elif resource_type == 'pyq':
-                kwargs['pyq_link'] = link
-            
-            if add_resource(**kwargs):
-                update.message.reply_text(
-                    f"✨ *Resource added successfully!*\n\n"
-                    f"- Subject: *{subject_code}: {subject_name}*\n"
-                    f"- Unit: *{unit_number}*\n"
-                    f"- Type: *{resource_type}*\n\n"
-                    f"Use /add_resource again to add another resource.",
-                    parse_mode=ParseMode.MARKDOWN,
-                    reply_markup=reply_markup
-                )
-            else:
-                update.message.reply_text(
-                    "⚠️ Failed to add resource to the database. Please try again later.",
-                    parse_mode=ParseMode.MARKDOWN,
-                    reply_markup=reply_markup
-                )
+    # Store resource type
+    resource_data['resource_type'] = resource_type
+    context.user_data['add_resource'] = resource_data
+    context.user_data['conversation_state'] = ADD_RESOURCE_LINK
+    
+    # Remove custom keyboard
+    reply_markup = _REMOVE_KB
+    
+    update.message.reply_text(
+        f"📚 *Add New Resource - Step 5/5*\n\n"
+        f"Resource type: *{resource_type}*\n\n"
+        f"Please enter the resource *link* (must start with http:// or https://):",
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=reply_markup
+    )
+
+def _handle_resource_link(update: Update, context: CallbackContext, resource_data, message_text):
+    """Store the link and show the summary for confirmation."""
+    # Process resource link
+    link = message_text.strip()
+    
+    # Validate link format
+    if not _URL_RE.match(link):
+        update.message.reply_text(
+            f"⚠️ {_URL_ERR}. Please enter a valid link:",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    
+    # Store link
+    resource_data['link'] = link
+    context.user_data['add_resource'] = resource_data
+    context.user_data['conversation_state'] = ADD_CONFIRMATION
+    
+    # Create a confirmation keyboard
+    reply_markup = _CONFIRM_KB
+    
+    # Show summary for confirmation
+    update.message.reply_text(
+        f"📝 *Resource Addition - Confirmation*\n\n"
+        f"Please review the resource details:\n\n"
+        f"- Subject Code: *{resource_data['subject_code']}*\n"
+        f"- Subject Name: *{resource_data['subject_name']}*\n"
+        f"- Unit Number: *{resource_data['unit_number']}*\n"
+        f"- Resource Type: *{resource_data['resource_type']}*\n"
+        f"- Link: {resource_data['link']}\n\n"
+        f"Is this correct?",
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=reply_markup,
+        disable_web_page_preview=True
+    )
+
+def _handle_confirmation(update: Update, context: CallbackContext, resource_data, message_text):
+    """Add the resource if confirmed and end the conversation."""
+    # Process confirmation
+    confirmation = message_text.strip().lower()
+    
+    # Remove custom keyboard
+    reply_markup = _REMOVE_KB
+    
+    if "confirm" in confirmation or "✅" in confirmation:
+        # Add the resource to the database
+        subject_code = resource_data['subject_code']
+        subject_name = resource_data['subject_name']
+        unit_number = resource_data['unit_number']
+        resource_type = resource_data['resource_type']
+        link = resource_data['link']
+    
+        # Prepare kwargs for add_resource
+        kwargs = {
+            'subject_code': subject_code,
+            'subject_name': subject_name,
+            'unit_number': unit_number
+        }
+    
+        if resource_type == 'notes':
+            kwargs['notes_link'] = link
+        elif resource_type == 'ppt':
+            kwargs['ppt_link'] = link
+        elif resource_type == 'pyq':
+            kwargs['pyq_link'] = link
+    
+        if add_resource(**kwargs):
+            update.message.reply_text(
+                f"✨ *Resource added successfully!*\n\n"
+                f"- Subject: *{subject_code}: {subject_name}*\n"
+                f"- Unit: *{unit_number}*\n"
+                f"- Type: *{resource_type}*\n\n"
+                f"Use /add_resource again to add another resource.",
+                parse_mode=ParseMode.MARKDOWN,
+                reply_markup=reply_markup
+            )
         else:
             update.message.reply_text(
-                "\ud83d\udeab Resource addition canceled.\n\nUse /add_resource to start again.",
+                "⚠️ Failed to add resource to the database. Please try again later.",
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=reply_markup
             )
-        
-        # Clear conversation state
-        if 'conversation_state' in context.user_data:
-            del context.user_data['conversation_state']
-        if 'add_resource' in context.user_data:
-            del context.user_data['add_resource']
+    else:
+        update.message.reply_text(
+            "\ud83d\udeab Resource addition canceled.\n\nUse /add_resource to start again.",
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=reply_markup
+        )
+    
+    # Clear conversation state
+    if 'conversation_state' in context.user_data:
+        del context.user_data['conversation_state']
+    if 'add_resource' in context.user_data:
+        del context.user_data['add_resource']
 
-def grant_access_handler(update: Update, context: CallbackContext):
-    """Handle the /grant_access command (admin only)."""
+# Resource addition step handlers, keyed by conversation state
+_STATE_HANDLERS = {
+    ADD_SUBJECT_CODE: _handle_subject_code,
+    ADD_SUBJECT_NAME: _handle_subject_name,
+    ADD_UNIT_NUMBER: _handle_unit_number,
+    ADD_RESOURCE_TYPE: _handle_resource_type,
+    ADD_RESOURCE_LINK: _handle_resource_link,
+    ADD_CONFIRMATION: _handle_confirmation,
+}
+
+def process_resource_conversation(update: Update, context: CallbackContext):
+    """Process each step of the resource addition conversation."""
     telegram_id = update.effective_user.id
+    message_text = update.message.text.strip()
+    
+    # Only admin can use this conversation
+    if telegram_id != ADMIN_ID_INT:
+        return
     
-    # Check if the user is an admin
-    if str(telegram_id) != ADMIN_ID:
-        update.message.reply_text("⚠️ This command is for administrators only.")
+    # Check if we're in a resource addition conversation
+    if 'conversation_state' not in context.user_data:
         return
     
+    state = context.user_data['conversation_state']
+    resource_data = context.user_data.get('add_resource', {})
+    
+    # Hand the message to the step for the current state
+    step_handler = _STATE_HANDLERS.get(state)
+    if step_handler:
+        step_handler(update, context, resource_data, message_text)
+
+@admin_only
+def grant_access_handler(update: Update, context: CallbackContext):
+    """Handle the /grant_access command (admin only)."""
     # Check if Telegram ID is provided
     if not context.args or len(context.args) < 1:
         update.message.reply_text(
@@ -673,23 +785,31 @@ def grant_access_handler(update: Update, context: CallbackContext):
     else:
         update.message.reply_text(f"⚠️ Failed to grant access to user with Telegram ID *{user_telegram_id}*.", parse_mode=ParseMode.MARKDOWN)
 
+@dataclass(slots=True)
+class AnimState:
+    """Progress of one loading animation, passed between its job runs."""
+    chat_id: int
+    message_id: int
+    loading_messages: tuple
+    current_index: int
+    final_message: str
+    buttons: tuple
+
 def animate_resource_loading(context: CallbackContext):
     """Job callback to animate resource loading with a sequence of messages."""
-    job_data = context.job.context
+    state = context.job.context
     try:
-        current_index = job_data['current_index']
-        loading_messages = job_data['loading_messages']
+        loading_messages = state.loading_messages
         
         # If we haven't shown all loading messages yet, show the next one
-        if current_index < len(loading_messages) - 1:
-            current_index += 1
-            job_data['current_index'] = current_index
+        if state.current_index < len(loading_messages) - 1:
+            state.current_index += 1
             
             # Edit the message to show the next loading message
             context.bot.edit_message_text(
-                chat_id=job_data['chat_id'],
-                message_id=job_data['message_id'],
-                text=loading_messages[current_index],
+                chat_id=state.chat_id,
+                message_id=state.message_id,
+                text=loading_messages[state.current_index],
                 parse_mode=ParseMode.MARKDOWN
             )
             
@@ -697,17 +817,18 @@ def animate_resource_loading(context: CallbackContext):
             context.job_queue.run_once(
                 animate_resource_loading, 
                 0.5,  # Slightly longer delay for reading
-                context=job_data
+                context=state
             )
         else:
-            # We've shown all loading messages, now show the actual resources
+            # We've shown all loading messages, now show the actual resources;
+            # the copy buttons are only turned into Telegram objects at this point
             context.bot.edit_message_text(
-                chat_id=job_data['chat_id'],
-                message_id=job_data['message_id'],
-                text=job_data['final_message'],
+                chat_id=state.chat_id,
+                message_id=state.message_id,
+                text=state.final_message,
                 parse_mode=ParseMode.MARKDOWN,
                 disable_web_page_preview=True,
-                reply_markup=job_data['reply_markup']
+                reply_markup=build_resource_keyboard(state.buttons)
             )
     except Exception as e:
         logger.error(f"Failed during resource loading animation: {e}")
@@ -721,20 +842,8 @@ def button_callback_handler(update: Update, context: CallbackContext):
     # Always answer the callback query to remove the loading state
     query.answer()
     
-    # Handle admin panel buttons (only for admin)
-    if data.startswith("admin_") and str(telegram_id) == ADMIN_ID:
-        handle_admin_button(query, context)
-        return
-    
-    # Handle copy buttons for resource links
-    if data.startswith("copy_"):
-        # The format is "copy_<link>"
-        link = data[5:]  # Remove the "copy_" prefix to get the actual link
-        query.message.reply_text(
-            f"🔗 *Here's your link:*\n{link}", 
-            parse_mode=ParseMode.MARKDOWN,
-            disable_web_page_preview=True
-        )
+    # Handle admin panel buttons, including approvals and paging (only for admin)
+    if telegram_id == ADMIN_ID_INT and handle_admin_button(query, context):
         return
     
     # Handle menu navigation buttons
@@ -744,218 +853,288 @@ def button_callback_handler(update: Update, context: CallbackContext):
         admin_panel_message(query.message, context)
         return
 
-def handle_admin_button(query: CallbackQuery, context: CallbackContext):
-    """Handle admin panel button clicks."""
-    data = query.data
-    message = query.message
-    
-    # Handle different admin panel sections
-    if data == "admin_verify":
-        # Show verification requests panel
-        show_verification_panel(message, context)
-    
-    elif data == "admin_resources":
-        # Show resource management panel
-        show_resource_panel(message, context)
-    
-    elif data == "admin_users":
-        # Show user management panel
-        show_user_panel(message, context)
+# Admin panel text and keyboards that don't change between clicks; the panels are
+# Telegram HTML, filled in through _panel_values so dynamic values get escaped
+_ADMIN_PANEL_HTML = (
+    "🟥🟧🟨🟩 <b>ADMIN CONTROL PANEL</b> 🟩🟨🟧🟥\n"
+    "Welcome, Admin! Manage the bot with ease.\n\n"
+    "📊 <b>System Overview</b>\n"
+    "• Total Users: {total_users} | Active Subscribers: {active_subscribers}\n"
+    "• Verified Payments: {total_payments} | Pending Requests: {pending_count}\n"
+    "• Most Accessed Resource: {most_accessed_subject}\n"
+    "• Time: {now}\n\n"
+    "🛠️ <b>Control Menu</b>\n"
+    "[ Verification Requests ] [ Resource Management ]\n"
+    "[ User Management ]      [ System Stats ]\n\n"
+    "ℹ️ Select an option below to proceed."
+)
+_RESOURCE_PANEL_HTML = (
+    "📚 <b>Resource Management</b>\n\n"
+    "Total Resources: {total_resources} | Subjects: {subject_count}\n\n"
+    "Use these commands to manage resources:\n\n"
+    "• <code>/add_resource</code> - Add new resource\n"
+    "• <code>/edit_resource &lt;code&gt; &lt;unit&gt; &lt;type&gt; &lt;new_link&gt;</code> - Edit link\n"
+    "• <code>/remove_resource &lt;code&gt; &lt;unit&gt; &lt;type&gt;</code> - Remove resource\n"
+    "• <code>/delete_subject &lt;code&gt;</code> - Delete subject\n"
+    "• <code>/upload_json</code> - Bulk upload resources\n"
+)
+_USER_PANEL_HTML = (
+    "👤 <b>User Management</b>\n\n"
+    "Total Users: {total_users} | Active Subscribers: {active_subscribers}\n\n"
+    "Use these commands to manage users:\n\n"
+    "• <code>/grant_access &lt;telegram_id&gt;</code> - Give subscription\n"
+    "• <code>/stats</code> - View detailed statistics\n"
+)
+_STATS_PANEL_HTML = (
+    "📊 <b>System Status</b>\n\n"
+    "Most Accessed: {most_accessed_subject}\n"
+    "Verified Payments: {total_payments}\n"
+    "Total Users: {total_users}\n"
+    "Active Subscribers: {active_subscribers}\n"
+    "Pending Payments: {pending_payments}\n"
+    "Total Resources: {total_resources}\n"
+    "Subject Count: {subject_count}\n"
+    "Current Time: {now}\n"
+)
+
+def _panel_values(stats, **extra):
+    """Return the stats as HTML-escaped strings for the panel templates, plus any extra values."""
+    values = {key: html.escape(str(value)) for key, value in stats.items()}
+    values.update(extra)
+    return values
+
+_ADMIN_ROOT_KB = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("📳 Verification", callback_data="admin_verify"),
+        InlineKeyboardButton("📚 Resources", callback_data="admin_resources")
+    ],
+    [
+        InlineKeyboardButton("👤 Users", callback_data="admin_users"),
+        InlineKeyboardButton("📊 Stats", callback_data="admin_stats")
+    ]
+])
+# "« Back to Menu" row shared by every admin sub-panel, and the markup holding only it
+_BACK_ROW = [InlineKeyboardButton("« Back to Menu", callback_data="back_to_admin")]
+_BACK_MARKUP = InlineKeyboardMarkup([_BACK_ROW])
+_RESOURCE_PANEL_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Add Resource", callback_data="open_add_resource")],
+    [InlineKeyboardButton("Upload JSON File", callback_data="open_upload_json")],
+    _BACK_ROW
+])
+_USER_PANEL_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Grant Access", callback_data="open_grant_access")],
+    [InlineKeyboardButton("View Statistics", callback_data="admin_stats")],
+    _BACK_ROW
+])
+
+def _edit_panel(message, text, reply_markup):
+    """Edit an admin panel message in place.
     
-    elif data == "admin_stats":
-        # Show system stats panel
-        show_stats_panel(message, context)
+    Telegram rejects edits that leave a message unchanged, e.g. when a panel
+    button is tapped twice; that case is ignored instead of raised.
+    """
+    try:
+        message.edit_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+    except BadRequest as e:
+        if 'not modified' not in str(e):
+            raise
+
+def _prompt_add_resource(message, context):
+    """Point the admin to the /add_resource conversation."""
+    message.reply_text(
+        "📝 Please use the `/add_resource` command to start the interactive resource addition process.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+def _prompt_grant_access(message, context):
+    """Point the admin to the /grant_access command."""
+    message.reply_text(
+        "🔑 Please use the `/grant_access <telegram_id>` command to grant subscription access.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+def _confirm_delete_button(message, context, subject_code):
+    """Delete the subject confirmed from the /delete_subject prompt."""
+    success, result_text = delete_subject(subject_code)
     
-    # Handle specific action buttons
-    elif data.startswith("approve_payment_"):
-        # Extract reference ID and approve payment
-        ref_id = data[16:]  # Remove "approve_payment_" prefix
-        handle_payment_approval(ref_id, message, context)
+    if success:
+        message_text = f"✅ {result_text}"
+    else:
+        message_text = f"⚠️ Failed to delete subject: {result_text}"
     
-    elif data.startswith("open_add_resource"):
-        # Prompt admin to use /add_resource command
-        message.reply_text(
-            "📝 Please use the `/add_resource` command to start the interactive resource addition process.",
-            parse_mode=ParseMode.MARKDOWN
-        )
+    # Replace the prompt so its buttons can't be pressed again
+    message.edit_text(message_text, parse_mode=ParseMode.MARKDOWN)
+
+def _cancel_delete_button(message, context):
+    """Dismiss the /delete_subject prompt without deleting anything."""
+    message.edit_text("🚫 Subject deletion cancelled.", parse_mode=ParseMode.MARKDOWN)
+
+def _approve_payment_button(message, context, data):
+    """Approve the payment carried in the callback data as "<page>_<reference ID>"."""
+    page, _, ref_id = data.partition("_")
+    if not page.isdigit():
+        # Button drawn before the page was part of the data
+        page, ref_id = "0", data
+    handle_payment_approval(ref_id, message, context, page=int(page))
+
+def _verification_page_button(message, context, page):
+    """Show the verification panel page named in the callback data."""
+    if page.isdigit():
+        show_verification_panel(message, context, page=int(page))
+
+def handle_admin_button(query: CallbackQuery, context: CallbackContext):
+    """Handle admin panel button clicks; returns False if the callback isn't an admin button."""
+    data = query.data
+    message = query.message
     
-    elif data.startswith("open_grant_access"):
-        # Prompt admin to use /grant_access command
-        message.reply_text(
-            "🔑 Please use the `/grant_access <telegram_id>` command to grant subscription access.",
-            parse_mode=ParseMode.MARKDOWN
-        )
+    # Panel sections are matched on the whole callback data
+    handler = _ADMIN_BUTTONS.get(data)
+    if handler:
+        handler(message, context)
+        return True
+    
+    # Action buttons carry an argument after their prefix
+    for prefix, handler in _ADMIN_BUTTON_PREFIXES:
+        if data.startswith(prefix):
+            handler(message, context, data.removeprefix(prefix))
+            return True
+    return False
+
+# Pending requests listed per page of the verification panel
+VERIFY_PAGE_SIZE = 5
 
-def show_verification_panel(message, context):
-    """Show the verification requests panel."""
-    # Get pending verification requests
-    pending_requests = get_pending_verification_requests()
-    pending_count = len(pending_requests)
+def _pager(current, total_pages, prefix):
+    """Build an inline keyboard row for paging: ⏮ ◀ current/total ▶ ⏭.
+    
+    Pages are 0-based in callback data (``prefix`` + page number) and 1-based on
+    the labels. Buttons that would lead nowhere are left out.
+    """
+    row = []
+    if current > 0:
+        if current > 1:
+            row.append(InlineKeyboardButton("⏮", callback_data=f"{prefix}0"))
+        row.append(InlineKeyboardButton("◀", callback_data=f"{prefix}{current - 1}"))
+    row.append(InlineKeyboardButton(f"{current + 1}/{total_pages}", callback_data=f"{prefix}{current}"))
+    if current < total_pages - 1:
+        row.append(InlineKeyboardButton("▶", callback_data=f"{prefix}{current + 1}"))
+        if current < total_pages - 2:
+            row.append(InlineKeyboardButton("⏭", callback_data=f"{prefix}{total_pages - 1}"))
+    return row
+
+def show_verification_panel(message, context, page=0, pending=None):
+    """Show one page of the verification requests panel.
+    
+    Callers that already hold the requested page as a (requests, total) pair,
+    as returned by get_pending_verification_requests, can pass it as
+    ``pending`` to skip fetching it again.
+    """
+    # Get this page of pending verification requests
+    if pending is None:
+        pending = get_pending_verification_requests(limit=VERIFY_PAGE_SIZE, offset=page * VERIFY_PAGE_SIZE)
+    pending_requests, pending_count = pending
+    total_pages = max(1, -(-pending_count // VERIFY_PAGE_SIZE))
+    
+    # The queue may have shrunk since the page button was drawn; show the last page instead
+    if page >= total_pages:
+        page = total_pages - 1
+        pending_requests, pending_count = get_pending_verification_requests(
+            limit=VERIFY_PAGE_SIZE, offset=page * VERIFY_PAGE_SIZE
+        )
+        total_pages = max(1, -(-pending_count // VERIFY_PAGE_SIZE))
     
     # Create verification panel message
-    header = "💳 *Verification Requests*\n\n"
+    header = "💳 <b>Verification Requests</b>\n\n"
+    keyboard = []
     
     if pending_count > 0:
-        content = f"Found {pending_count} pending payment verification{'s' if pending_count > 1 else ''}:\n\n"
+        content_parts = [f"Found {pending_count} pending payment verification{'s' if pending_count > 1 else ''}:\n\n"]
         
-        # List all pending requests with approve buttons
-        for i, request in enumerate(pending_requests[:5]):  # Show up to 5 requests
-            telegram_id = request['telegram_id']
+        # List this page's requests, each with its approve button
+        for i, request in enumerate(pending_requests, page * VERIFY_PAGE_SIZE + 1):
             ref_id = request['reference_id']
-            request_time = request['request_time']
-            
-            content += f"{i+1}. User ID: `{telegram_id}`\n"
-            content += f"   Reference: `{ref_id}`\n"
-            content += f"   Time: {request_time}\n\n"
+            content_parts.append(
+                f"{i}. User ID: <code>{request['telegram_id']}</code>\n"
+                f"   Reference: <code>{html.escape(ref_id)}</code>\n"
+                f"   Time: {html.escape(str(request['request_time']))}\n\n"
+            )
+            keyboard.append([InlineKeyboardButton(
+                f"Approve #{i}: {ref_id}", 
+                callback_data=f"approve_payment_{page}_{ref_id}"
+            )])
         
-        if pending_count > 5:
-            content += f"_...and {pending_count - 5} more pending requests._\n\n"
+        if total_pages > 1:
+            keyboard.append(_pager(page, total_pages, "verify_page_"))
+        content = "".join(content_parts)
     else:
         content = "No pending verification requests.\n\n"
     
-    # Create keyboard with approve buttons for each request
-    keyboard = []
-    
-    if pending_count > 0:
-        # Add approval buttons for each request (up to 5)
-        for i, request in enumerate(pending_requests[:5]):
-            keyboard.append([InlineKeyboardButton(
-                f"Approve #{i+1}: {request['reference_id']}", 
-                callback_data=f"approve_payment_{request['reference_id']}"
-            )])
-    
-    # Add back button
-    keyboard.append([InlineKeyboardButton("« Back to Menu", callback_data="back_to_admin")])
-    
-    # Construct reply markup
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Add back button; with nothing pending the shared back-only markup will do
+    if keyboard:
+        keyboard.append(_BACK_ROW)
+        reply_markup = InlineKeyboardMarkup(keyboard)
+    else:
+        reply_markup = _BACK_MARKUP
     
     # Send or edit message
-    message.edit_text(
-        header + content,
-        reply_markup=reply_markup,
-        parse_mode=ParseMode.MARKDOWN
-    )
+    _edit_panel(message, header + content, reply_markup)
 
 def show_resource_panel(message, context):
     """Show the resource management panel."""
     # Get resource statistics
-    stats = get_user_stats()
-    
-    # Create resource panel message
-    header = "📚 *Resource Management*\n\n"
-    content = f"Total Resources: {stats['total_resources']} | Subjects: {stats['subject_count']}\n\n"
-    content += "Use these commands to manage resources:\n\n"
-    content += "• `/add_resource` - Add new resource\n"
-    content += "• `/edit_resource <code> <unit> <type> <new_link>` - Edit link\n"
-    content += "• `/remove_resource <code> <unit> <type>` - Remove resource\n"
-    content += "• `/delete_subject <code>` - Delete subject\n"
-    content += "• `/upload_json` - Bulk upload resources\n"
-    
-    # Create keyboard with resource management buttons
-    keyboard = [
-        [InlineKeyboardButton("Add Resource", callback_data="open_add_resource")],
-        [InlineKeyboardButton("Upload JSON File", callback_data="open_upload_json")],
-        [InlineKeyboardButton("« Back to Menu", callback_data="back_to_admin")]
-    ]
+    stats = get_cached_user_stats()
     
-    # Construct reply markup
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    # Send or edit message
-    message.edit_text(
-        header + content,
-        reply_markup=reply_markup,
-        parse_mode=ParseMode.MARKDOWN
-    )
+    # Only the counts change between renders
+    _edit_panel(message, _RESOURCE_PANEL_HTML.format_map(_panel_values(stats)), _RESOURCE_PANEL_KB)
 
 def show_user_panel(message, context):
     """Show the user management panel."""
     # Get user statistics
-    stats = get_user_stats()
+    stats = get_cached_user_stats()
     
-    # Create user panel message
-    header = "👤 *User Management*\n\n"
-    content = f"Total Users: {stats['total_users']} | Active Subscribers: {stats['active_subscribers']}\n\n"
-    content += "Use these commands to manage users:\n\n"
-    content += "• `/grant_access <telegram_id>` - Give subscription\n"
-    content += "• `/stats` - View detailed statistics\n"
-    
-    # Create keyboard with user management buttons
-    keyboard = [
-        [InlineKeyboardButton("Grant Access", callback_data="open_grant_access")],
-        [InlineKeyboardButton("View Statistics", callback_data="admin_stats")],
-        [InlineKeyboardButton("« Back to Menu", callback_data="back_to_admin")]
-    ]
-    
-    # Construct reply markup
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    # Send or edit message
-    message.edit_text(
-        header + content,
-        reply_markup=reply_markup,
-        parse_mode=ParseMode.MARKDOWN
-    )
+    # Only the counts change between renders
+    _edit_panel(message, _USER_PANEL_HTML.format_map(_panel_values(stats)), _USER_PANEL_KB)
 
 def show_stats_panel(message, context):
     """Show the system statistics panel."""
     # Get system statistics
-    stats = get_user_stats()
-    
-    # Create stats panel message
-    header = "📊 *System Status*\n\n"
-    content = f"Most Accessed: {stats.get('most_accessed_subject', 'None')}\n"
-    content += f"Verified Payments: {stats['total_payments']}\n"
-    content += f"Total Users: {stats['total_users']}\n"
-    content += f"Active Subscribers: {stats['active_subscribers']}\n"
-    content += f"Pending Payments: {stats['pending_payments']}\n"
-    content += f"Total Resources: {stats['total_resources']}\n"
-    content += f"Subject Count: {stats['subject_count']}\n"
-    content += f"Current Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-    
-    # Create keyboard with back button
-    keyboard = [
-        [InlineKeyboardButton("« Back to Menu", callback_data="back_to_admin")]
-    ]
-    
-    # Construct reply markup
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    stats = get_cached_user_stats()
     
-    # Send or edit message
-    message.edit_text(
-        header + content,
-        reply_markup=reply_markup,
-        parse_mode=ParseMode.MARKDOWN
-    )
+    # Only the counts and the time change between renders
+    now = datetime.now().isoformat(sep=' ', timespec='seconds')
+    _edit_panel(message, _STATS_PANEL_HTML.format_map(_panel_values(stats, now=now)), _BACK_MARKUP)
+
+# Threads for sending the approval notifications alongside the panel refresh.
+# Kept separate from the dispatcher's workers, which the calling handler occupies.
+_notify_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="approval-notify")
 
-def handle_payment_approval(ref_id, message, context):
-    """Handle payment approval from admin panel."""
+def handle_payment_approval(ref_id, message, context, page=0):
+    """Handle payment approval from admin panel, then redraw the panel at ``page``."""
     # Verify the payment
     verified_telegram_id = verify_payment(ref_id)
     
     if verified_telegram_id:
         # Notify admin of successful verification
-        notification = f"✅ Payment with reference ID *{ref_id}* has been verified successfully!"
-        message.reply_text(notification, parse_mode=ParseMode.MARKDOWN)
+        notification = _MSG_PAYMENT_VERIFIED_ADMIN.format(reference_id=ref_id)
+        admin_reply = _notify_pool.submit(message.reply_text, notification, parse_mode=ParseMode.MARKDOWN)
         
         # Notify the user
-        user_message = (
-            f"🎉 Your payment with reference ID *{ref_id}* has been verified!\n\n"
-            f"Your subscription is now active for 1 week. Enjoy unlimited searches!"
+        user_message = _MSG_PAYMENT_VERIFIED_USER.format(reference_id=ref_id)
+        user_notice = _notify_pool.submit(
+            context.bot.send_message,
+            chat_id=verified_telegram_id,
+            text=user_message,
+            parse_mode=ParseMode.MARKDOWN
         )
         
+        # Refresh the admin's page of the verification panel while both
+        # notifications are in flight (clamped if it no longer exists)
+        show_verification_panel(message, context, page=page)
+        
         try:
-            context.bot.send_message(
-                chat_id=verified_telegram_id,
-                text=user_message,
-                parse_mode=ParseMode.MARKDOWN
-            )
+            user_notice.result()
         except Exception as e:
             logger.error(f"Failed to notify user {verified_telegram_id}: {e}")
-        
-        # Refresh the verification panel
-        show_verification_panel(message, context)
+        admin_reply.result()
     else:
         # Notify admin of failed verification
         message.reply_text(
@@ -964,65 +1143,49 @@ def handle_payment_approval(ref_id, message, context):
             parse_mode=ParseMode.MARKDOWN
         )
 
+# Admin panel callback routing, looked up by handle_admin_button
+_ADMIN_BUTTONS = {
+    "admin_verify": show_verification_panel,
+    "admin_resources": show_resource_panel,
+    "admin_users": show_user_panel,
+    "admin_stats": show_stats_panel,
+    "open_add_resource": _prompt_add_resource,
+    "open_grant_access": _prompt_grant_access,
+    "cancel_delete": _cancel_delete_button,
+}
+_ADMIN_BUTTON_PREFIXES = (
+    ("approve_payment_", _approve_payment_button),
+    ("verify_page_", _verification_page_button),
+    ("confirm_delete_", _confirm_delete_button),
+)
+
 def admin_panel_message(message, context):
     """Generate and send/edit the admin panel message."""
-    # Get pending verification requests
-    pending_requests = get_pending_verification_requests()
-    pending_count = len(pending_requests)
-    
-    # Get current statistics
-    stats = get_user_stats()
+    # Get current statistics and the pending request count together
+    payload = get_admin_dashboard_payload()
+    pending_count = payload["pending_total"]
+    stats = payload["stats"]
     if not stats:
         message.reply_text("⚠️ Failed to retrieve statistics.")
         return
     
-    # Create a more visual header for the admin panel
-    color_gradient = "🟥🟧🟨🟩"
-    header_text = f"{color_gradient} *ADMIN CONTROL PANEL* {color_gradient[-1::-1]}\n"
-    header_text += "Welcome, Admin! Manage the bot with ease.\n\n"
-    
-    # Create message with system overview
-    msg_text = header_text
-    
-    # System Overview
-    msg_text += "📊 *System Overview*\n"
-    msg_text += f"• Total Users: {stats['total_users']} | Active Subscribers: {stats['active_subscribers']}\n"
-    msg_text += f"• Verified Payments: {stats['total_payments']} | Pending Requests: {pending_count}\n"
-    msg_text += f"• Most Accessed Resource: {stats.get('most_accessed_subject', 'None')}\n"
-    msg_text += f"• Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-    
-    # Control Menu Description
-    msg_text += "🛠️ *Control Menu*\n"
-    msg_text += "[ Verification Requests ] [ Resource Management ]\n"
-    msg_text += "[ User Management ]      [ System Stats ]\n\n"
-    msg_text += "ℹ️ Select an option below to proceed."
-    
-    # Create the inline keyboard with buttons
-    keyboard = [
-        [
-            InlineKeyboardButton("📳 Verification", callback_data="admin_verify"),
-            InlineKeyboardButton("📚 Resources", callback_data="admin_resources")
-        ],
-        [
-            InlineKeyboardButton("👤 Users", callback_data="admin_users"),
-            InlineKeyboardButton("📊 Stats", callback_data="admin_stats")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Fill the dynamic values into the prebuilt panel text
+    msg_text = _ADMIN_PANEL_HTML.format_map(_panel_values(
+        stats,
+        pending_count=pending_count,
+        now=datetime.now().isoformat(sep=' ', timespec='seconds')
+    ))
+    reply_markup = _ADMIN_ROOT_KB
     
     # Check if this is a new message or an edit
     if hasattr(message, 'edit_text'):  # This is a Message object from a callback query
         # Edit the existing message
-        message.edit_text(
-            msg_text, 
-            reply_markup=reply_markup, 
-            parse_mode=ParseMode.MARKDOWN
-        )
+        _edit_panel(message, msg_text, reply_markup)
     else:  # This is a fresh command, use reply_text
         message.reply_text(
             msg_text, 
             reply_markup=reply_markup, 
-            parse_mode=ParseMode.MARKDOWN
+            parse_mode=ParseMode.HTML
         )
 
 def my_history_handler(update: Update, context: CallbackContext):
@@ -1030,9 +1193,9 @@ def my_history_handler(update: Update, context: CallbackContext):
     telegram_id = update.effective_user.id
     username = update.effective_user.username or telegram_id
     
-    # Check if user exists in database
-    user = get_user(telegram_id)
-    if not user:
+    # Fetch the user's counts and subscription in one go
+    history = get_user_history(telegram_id)
+    if not history:
         # User doesn't exist in the database
         message = (
             f"👋 Hello @{username}!\n\n"
@@ -1042,11 +1205,7 @@ def my_history_handler(update: Update, context: CallbackContext):
         update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
         return
     
-    # Get current search count
-    searches_used = get_search_count(telegram_id)
-    
-    # Check subscription status
-    is_subscribed = check_subscription(telegram_id)
+    searches_used, is_subscribed, expiry_date = history
     
     # Format searches used message
     if is_subscribed:
@@ -1057,8 +1216,6 @@ def my_history_handler(update: Update, context: CallbackContext):
     
     # Format subscription message
     if is_subscribed:
-        # Get subscription expiry date
-        expiry_date = get_subscription_expiry(telegram_id)
         if expiry_date:
             # Format date as DD-MMM-YYYY
             formatted_date = expiry_date.strftime("%d-%b-%Y")
@@ -1078,15 +1235,21 @@ def my_history_handler(update: Update, context: CallbackContext):
     
     update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
 
+def animations_handler(update: Update, context: CallbackContext):
+    """Handle the /animations command, which turns the loading animation on or off."""
+    # Kept in user_data, where the subject lookup checks it before animating
+    enabled = not context.user_data.get('animations_enabled', False)
+    context.user_data['animations_enabled'] = enabled
+    
+    if enabled:
+        message = "✨ Loading animations are now *on*. Resources will appear after a short animation."
+    else:
+        message = "⚡ Loading animations are now *off*. Resources will appear straight away."
+    update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+
+@admin_only
 def remove_resource_handler(update: Update, context: CallbackContext):
     """Handle the /remove_resource command (admin only)."""
-    telegram_id = update.effective_user.id
-    
-    # Check if the user is an admin
-    if str(telegram_id) != ADMIN_ID:
-        update.message.reply_text("⚠️ This command is for administrators only.")
-        return
-    
     # Check if required arguments are provided
     if not context.args or len(context.args) < 3:
         update.message.reply_text(
@@ -1139,15 +1302,9 @@ def remove_resource_handler(update: Update, context: CallbackContext):
     
     update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
 
+@admin_only
 def edit_resource_handler(update: Update, context: CallbackContext):
     """Handle the /edit_resource command (admin only)."""
-    telegram_id = update.effective_user.id
-    
-    # Check if the user is an admin
-    if str(telegram_id) != ADMIN_ID:
-        update.message.reply_text("⚠️ This command is for administrators only.")
-        return
-    
     # Check if required arguments are provided
     if not context.args or len(context.args) < 4:
         update.message.reply_text(
@@ -1187,8 +1344,8 @@ def edit_resource_handler(update: Update, context: CallbackContext):
         return
     
     # Check if link is valid
-    if not new_link.startswith('http'):
-        update.message.reply_text("⚠️ Link must start with http:// or https://")
+    if not _URL_RE.match(new_link):
+        update.message.reply_text(f"⚠️ {_URL_ERR}")
         return
     
     # Edit the resource
@@ -1207,38 +1364,28 @@ def edit_resource_handler(update: Update, context: CallbackContext):
     
     update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
 
+@admin_only
 def delete_subject_handler(update: Update, context: CallbackContext):
     """Handle the /delete_subject command (admin only)."""
-    telegram_id = update.effective_user.id
-    
-    # Check if the user is an admin
-    if str(telegram_id) != ADMIN_ID:
-        update.message.reply_text("⚠️ This command is for administrators only.")
-        return
+    # Extract argument
+    subject_code = context.args[0].upper() if context.args else ""
     
-    # Check if subject code is provided
-    if not context.args or len(context.args) < 1:
+    # Check that a subject code is provided and valid (2-3 letters followed by 3
+    # digits), which also keeps the confirm button's data within Telegram's limit
+    if not ADD_SUBJECT_CODE_RE.match(subject_code):
         update.message.reply_text(
-            "⚠️ Please provide a subject code.\n"
+            "⚠️ Please provide a valid subject code.\n"
             "Format: `/delete_subject <code>`\n"
             "Example: `/delete_subject CSE211`",
             parse_mode=ParseMode.MARKDOWN
         )
         return
     
-    # Extract argument
-    subject_code = context.args[0].upper()
-    
-    # Create a confirmation keyboard
-    keyboard = [
-        ["✅ Confirm Delete", "❌ Cancel"]
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    # Ask for confirmation before deleting
-    context.user_data['delete_subject'] = {
-        'subject_code': subject_code
-    }
+    # Ask for confirmation before deleting; the subject travels in the button data
+    reply_markup = InlineKeyboardMarkup([[
+        InlineKeyboardButton("✅ Confirm Delete", callback_data=f"confirm_delete_{subject_code}"),
+        InlineKeyboardButton("❌ Cancel", callback_data="cancel_delete")
+    ]])
     
     message = (
         f"⚠️ *WARNING: You are about to delete all resources for {subject_code}*\n\n"
@@ -1251,95 +1398,102 @@ def delete_subject_handler(update: Update, context: CallbackContext):
         reply_markup=reply_markup
     )
 
-def process_delete_subject_confirmation(update: Update, context: CallbackContext):
-    """Process confirmation for subject deletion."""
-    telegram_id = update.effective_user.id
-    message_text = update.message.text
-    
-    # Only admin can use this
-    if str(telegram_id) != ADMIN_ID:
-        return
-    
-    # Check if we're awaiting confirmation
-    if 'delete_subject' not in context.user_data:
-        return
-    
-    # Remove custom keyboard
-    reply_markup = ReplyKeyboardRemove()
-    
-    if "✅" in message_text or "Confirm" in message_text:
-        # Confirmed - delete the subject
-        subject_code = context.user_data['delete_subject']['subject_code']
-        success, message_text = delete_subject(subject_code)
-        
-        if success:
-            message = f"✅ {message_text}"
-        else:
-            message = f"⚠️ Failed to delete subject: {message_text}"
-    else:
-        # Cancelled
-        message = "🚫 Subject deletion cancelled."
-    
-    # Clear the confirmation state
-    del context.user_data['delete_subject']
-    
-    update.message.reply_text(
-        message, 
-        parse_mode=ParseMode.MARKDOWN,
-        reply_markup=reply_markup
-    )
+# Instructions shown by /upload_json
+_UPLOAD_JSON_INSTRUCTIONS = (
+    "📚 *Bulk Resource Upload*\n\n"
+    "Please upload a JSON file with the following format:\n\n"
+    "```\n"
+    "[\n"
+    "  {\n"
+    "    \"subject_code\": \"CSE211\",\n"
+    "    \"subject_name\": \"Data Structures\",\n"
+    "    \"unit\": 1,\n"
+    "    \"type\": \"notes\",\n"
+    "    \"link\": \"https://example.com/notes\"\n"
+    "  },\n"
+    "  {\n"
+    "    \"subject_code\": \"CSE211\",\n"
+    "    \"subject_name\": \"Data Structures\",\n"
+    "    \"unit\": 1,\n"
+    "    \"type\": \"ppt\",\n"
+    "    \"link\": \"https://example.com/ppt\"\n"
+    "  }\n"
+    "]\n"
+    "```\n\n"
+    "Each object must contain:\n"
+    "- `subject_code`: Course code (e.g., CSE211)\n"
+    "- `subject_name`: Full name of the subject\n"
+    "- `unit`: Unit number (1-6)\n"
+    "- `type`: Resource type (must be one of: notes, ppt, pyq)\n"
+    "- `link`: URL to the resource (must start with http:// or https://)\n\n"
+    "Now, please upload your JSON file."
+)
 
+@admin_only
 def upload_json_handler(update: Update, context: CallbackContext):
     """Handle the /upload_json command to bulk upload resources via a JSON file (admin only)."""
-    telegram_id = update.effective_user.id
-    
-    # Check if the user is an admin
-    if str(telegram_id) != ADMIN_ID:
-        update.message.reply_text("⚠️ This command is for administrators only.")
-        return
-    
     # Store state to listen for file upload
     context.user_data['awaiting_json'] = True
     
     # Provide instructions for JSON format
-    instructions = (
-        f"📚 *Bulk Resource Upload*\n\n"
-        f"Please upload a JSON file with the following format:\n\n"
-        "```\n"
-        "[\n"
-        "  {\n"
-        "    \"subject_code\": \"CSE211\",\n"
-        "    \"subject_name\": \"Data Structures\",\n"
-        "    \"unit\": 1,\n"
-        "    \"type\": \"notes\",\n"
-        "    \"link\": \"https://example.com/notes\"\n"
-        "  },\n"
-        "  {\n"
-        "    \"subject_code\": \"CSE211\",\n"
-        "    \"subject_name\": \"Data Structures\",\n"
-        "    \"unit\": 1,\n"
-        "    \"type\": \"ppt\",\n"
-        "    \"link\": \"https://example.com/ppt\"\n"
-        "  }\n"
-        "]\n"
-        "```\n\n"
-        f"Each object must contain:\n"
-        f"- `subject_code`: Course code (e.g., CSE211)\n"
-        f"- `subject_name`: Full name of the subject\n"
-        f"- `unit`: Unit number (1-6)\n"
-        f"- `type`: Resource type (must be one of: notes, ppt, pyq)\n"
-        f"- `link`: URL to the resource (must start with http:// or https://)\n\n"
-        f"Now, please upload your JSON file."
-    )
+    update.message.reply_text(_UPLOAD_JSON_INSTRUCTIONS, parse_mode=ParseMode.MARKDOWN)
+
+# Parse uploads with orjson when it's installed; it is an optional speedup and
+# its JSONDecodeError subclasses the stdlib one, so error handling is shared
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+# Largest JSON file accepted by /upload_json, in bytes
+MAX_JSON_UPLOAD_BYTES = 2 * 1024 * 1024
+
+# Most per-row errors listed in an upload report; the rest are only counted
+MAX_UPLOAD_ERRORS_SHOWN = 10
+
+# Fields every object in an uploaded JSON file must have
+_UPLOAD_REQUIRED_FIELDS = ('subject_code', 'subject_name', 'unit', 'type', 'link')
+_RESOURCE_TYPES = frozenset(('notes', 'ppt', 'pyq'))
+
+def _parse_upload_row(resource):
+    """Validate one uploaded resource object and turn it into a bulk_add_resources row.
     
-    update.message.reply_text(instructions, parse_mode=ParseMode.MARKDOWN)
+    Returns (row, None) for a valid object, or (None, error_message) otherwise.
+    """
+    if not all(key in resource for key in _UPLOAD_REQUIRED_FIELDS):
+        return None, "Missing required fields. Each resource must contain subject_code, subject_name, unit, type, and link."
+    
+    try:
+        unit = int(resource['unit'])
+    except (ValueError, TypeError):
+        return None, "Unit must be a number between 1 and 6."
+    if not 1 <= unit <= 6:
+        return None, "Unit number must be between 1 and 6."
+    
+    resource_type = resource['type'].lower()
+    if resource_type not in _RESOURCE_TYPES:
+        return None, "Resource type must be one of: notes, ppt, pyq."
+    
+    link = resource['link']
+    if not _URL_RE.match(link):
+        return None, f"{_URL_ERR}."
+    
+    # Only the link for this resource type is set
+    return (
+        resource['subject_code'].upper(),
+        resource['subject_name'],
+        unit,
+        link if resource_type == 'notes' else None,
+        link if resource_type == 'ppt' else None,
+        link if resource_type == 'pyq' else None
+    ), None
 
 def process_json_upload(update: Update, context: CallbackContext):
     """Process JSON file upload for bulk resource addition."""
     telegram_id = update.effective_user.id
     
     # Only admin can use this function
-    if str(telegram_id) != ADMIN_ID:
+    if telegram_id != ADMIN_ID_INT:
         return
     
     # Check if we're expecting a JSON upload
@@ -1358,14 +1512,21 @@ def process_json_upload(update: Update, context: CallbackContext):
         )
         return
     
+    # Refuse oversized uploads before downloading them
+    if document.file_size and document.file_size > MAX_JSON_UPLOAD_BYTES:
+        update.message.reply_text(
+            f"⚠️ The file is too large. Please upload at most {MAX_JSON_UPLOAD_BYTES // 1024} KB of JSON at a time.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    
     try:
         # Download the file
         file = context.bot.get_file(document.file_id)
         json_file = file.download_as_bytearray()
         
-        # Parse the JSON
-        import json
-        resources = json.loads(json_file.decode('utf-8'))
+        # Parse the JSON straight from the downloaded bytes, without a decoded copy
+        resources = _json_loads(json_file)
         
         # Validate the JSON format
         if not isinstance(resources, list):
@@ -1379,95 +1540,50 @@ def process_json_upload(update: Update, context: CallbackContext):
         successful_resources = 0
         failed_resources = 0
         subjects_added = set()
-        error_messages = []
+        error_messages = []  # only the first MAX_UPLOAD_ERRORS_SHOWN are kept
+        valid_rows = []
+        valid_indices = []
         
         # Process each resource
         for i, resource in enumerate(resources):
-            # Check for required fields
-            if not all(key in resource for key in ['subject_code', 'subject_name', 'unit', 'type', 'link']):
-                error_message = f"Resource #{i+1}: Missing required fields. Each resource must contain subject_code, subject_name, unit, type, and link."
-                error_messages.append(error_message)
+            row, error = _parse_upload_row(resource)
+            if error:
+                if failed_resources < MAX_UPLOAD_ERRORS_SHOWN:
+                    error_messages.append(f"Resource #{i+1}: {error}")
                 failed_resources += 1
                 continue
             
-            # Validate fields
-            subject_code = resource['subject_code'].upper()
-            subject_name = resource['subject_name']
-            
-            # Validate unit
-            try:
-                unit = int(resource['unit'])
-                if unit < 1 or unit > 6:
-                    error_message = f"Resource #{i+1}: Unit number must be between 1 and 6."
-                    error_messages.append(error_message)
+            valid_indices.append(i)
+            valid_rows.append(row)
+        
+        # Write all valid resources in one transaction
+        if valid_rows:
+            stored = bulk_add_resources(valid_rows)
+            for i, row, ok in zip(valid_indices, valid_rows, stored):
+                if ok:
+                    successful_resources += 1
+                    subjects_added.add(row[0])
+                else:
+                    if failed_resources < MAX_UPLOAD_ERRORS_SHOWN:
+                        error_messages.append(f"Resource #{i+1}: Failed to add resource to database.")
                     failed_resources += 1
-                    continue
-            except (ValueError, TypeError):
-                error_message = f"Resource #{i+1}: Unit must be a number between 1 and 6."
-                error_messages.append(error_message)
-                failed_resources += 1
-                continue
-            
-            # Validate resource type
-            resource_type = resource['type'].lower()
-            if resource_type not in ['notes', 'ppt', 'pyq']:
-                error_message = f"Resource #{i+1}: Resource type must be one of: notes, ppt, pyq."
-                error_messages.append(error_message)
-                failed_resources += 1
-                continue
-            
-            # Validate link
-            link = resource['link']
-            if not link.startswith('http'):
-                error_message = f"Resource #{i+1}: Link must start with http:// or https://."
-                error_messages.append(error_message)
-                failed_resources += 1
-                continue
-            
-            # Prepare arguments for add_resource function
-            kwargs = {
-                'subject_code': subject_code,
-                'subject_name': subject_name,
-                'unit_number': unit
-            }
-            
-            if resource_type == 'notes':
-                kwargs['notes_link'] = link
-            elif resource_type == 'ppt':
-                kwargs['ppt_link'] = link
-            elif resource_type == 'pyq':
-                kwargs['pyq_link'] = link
-            
-            # Add the resource to the database
-            if add_resource(**kwargs):
-                successful_resources += 1
-                subjects_added.add(subject_code)
-            else:
-                error_message = f"Resource #{i+1}: Failed to add resource to database."
-                error_messages.append(error_message)
-                failed_resources += 1
         
-        # Format response message
+        # Format response message from its parts
         if successful_resources > 0:
-            sorted_subjects = sorted(list(subjects_added))
-            success_message = f"✅ Successfully uploaded *{successful_resources}* resources for subject(s): *{', '.join(sorted_subjects)}*."
+            sorted_subjects = sorted(subjects_added)
+            parts = [f"✅ Successfully uploaded *{successful_resources}* resources for subject(s): *{', '.join(sorted_subjects)}*."]
             
             if failed_resources > 0:
-                error_summary = f"\n\n⚠️ *{failed_resources} resources could not be added due to errors:*"
+                parts.append(f"\n\n⚠️ *{failed_resources} resources could not be added due to errors:*")
                 # Show up to 5 error messages to avoid message length limits
-                if len(error_messages) > 5:
-                    error_detail = "\n- " + "\n- ".join(error_messages[:5]) + f"\n- ... and {len(error_messages) - 5} more errors."
-                else:
-                    error_detail = "\n- " + "\n- ".join(error_messages)
-                
-                message = success_message + error_summary + error_detail
-            else:
-                message = success_message
+                parts.extend(f"\n- {error}" for error in error_messages[:5])
+                if failed_resources > 5:
+                    parts.append(f"\n- ... and {failed_resources - 5} more errors.")
         else:
-            message = "⚠️ Failed to add any resources. Please check the following errors:\n\n"
-            message += "- " + "\n- ".join(error_messages[:10])
-            if len(error_messages) > 10:
-                message += f"\n- ... and {len(error_messages) - 10} more errors."
+            parts = ["⚠️ Failed to add any resources. Please check the following errors:\n\n- ", "\n- ".join(error_messages)]
+            if failed_resources > MAX_UPLOAD_ERRORS_SHOWN:
+                parts.append(f"\n- ... and {failed_resources - MAX_UPLOAD_ERRORS_SHOWN} more errors.")
+        message = "".join(parts)
         
         update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
         
@@ -1483,27 +1599,15 @@ def process_json_upload(update: Update, context: CallbackContext):
             parse_mode=ParseMode.MARKDOWN
         )
 
+@admin_only
 def admin_panel_handler(update: Update, context: CallbackContext):
     """Handle the /admin command to show an admin panel with options."""
-    telegram_id = update.effective_user.id
-    
-    # Check if the user is an admin
-    if str(telegram_id) != ADMIN_ID:
-        update.message.reply_text("⚠️ This command is for administrators only.")
-        return
-    
     # Use the centralized admin panel message function
     admin_panel_message(update.message, context)
 
+@admin_only
 def stats_handler(update: Update, context: CallbackContext):
     """Handle the /stats command (admin only)."""
-    telegram_id = update.effective_user.id
-    
-    # Check if the user is an admin
-    if str(telegram_id) != ADMIN_ID:
-        update.message.reply_text("⚠️ This command is for administrators only.")
-        return
-    
     # Get statistics
     stats = get_user_stats()
     
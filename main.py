@@ -2,6 +2,7 @@ import os
 import logging
 import sys
 from flask_app import app
+from bot import setup_bot
 
 # Set up logging
 logging.basicConfig(
@@ -18,12 +19,13 @@ logger = logging.getLogger(__name__)
 
 def run_bot():
     """Run the Telegram bot."""
-    from bot import setup_bot
     try:
         # Initialize and start the bot
         setup_bot()
-    except Exception as e:
-        logger.error(f"Error in bot thread: {e}")
+    except Exception:
+        # Log the traceback, then let the process exit so its supervisor restarts it
+        logger.exception("Error in bot thread")
+        raise
 
 def main():
     """Start the application based on the command-line argument or environment."""
@@ -1,164 +1,212 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 import time
+import random
+import functools
+import threading
+from collections import namedtuple
 
+# Decorations for the loading animation and the resource message; built once
+# here rather than on every call
+
+# Color transition patterns using emoji gradients, for the loading messages
+_COLOR_TRANSITIONS = (
+    "🟩🟨🟧🟥",  # Green to yellow to orange to red
+    "🟦🟪🟫⬜",  # Blue to purple to brown to white
+    "⬜🟦🟩🟨",  # White to blue to green to yellow
+    "🟪🟦⬜🟨",  # Purple to blue to white to yellow
+    "🟥🟧🟨🟩"   # Red to orange to yellow to green
+)
+
+# Unicode block elements used as the loading messages' background
+_BACKGROUNDS = (
+    "░░░░░░░░",  # Light shade
+    "▒▒▒▒▒▒▒▒",  # Medium shade
+    "▓▓▓▓▓▓▓▓",  # Dark shade
+    "█████████"   # Full block
+)
+
+# Emoji tooltips for different resource types
+_NOTES_TOOLTIPS = (
+    "📝 Take better notes with these!", 
+    "✏️ Perfect study material!", 
+    "📚 Study smart, not hard!", 
+    "🧠 Knowledge at your fingertips!",
+    "📓 Comprehensive class notes!"
+)
+
+_PPT_TOOLTIPS = (
+    "🖼️ Visual learning rocks!", 
+    "👨‍🏫 Straight from the professor!", 
+    "📊 Slides to success!", 
+    "💻 PowerPoint perfection!",
+    "🎬 Presentation magic!"
+)
+
+_PYQ_TOOLTIPS = (
+    "📝 Practice makes perfect!", 
+    "🔍 See what to expect!", 
+    "❓ Test your knowledge!", 
+    "🎯 Aim for top marks!",
+    "⏳ Save study time!"
+)
+
+# Color gradients for the resource message's header, units and footer
+_COLOR_GRADIENTS = (
+    "🟥🟧🟨🟩",  # Red to orange to yellow to green
+    "🟩🟦🟪🟥",  # Green to blue to purple to red
+    "🟦🟪🟥🟧",  # Blue to purple to red to orange
+    "🟨🟩🟦🟪",  # Yellow to green to blue to purple
+    "🟪🟦🟩🟨"   # Purple to blue to green to yellow
+)
+
+_DOTS = "•" * 20  # Fancy background with dots
+_SEP = "✦" * 15
+_WAVE_PATTERN = "\u25fa\u25fb\u25fc\u25fd" * 5  # Alternating square patterns
+
+# Per-unit templates used by _build_resource_message
+_UNIT_HEADER = "{g}\n📌 *UNIT {u}* 📌\n{w}\n"
+# One row per resource kind: (kind, link line, missing line, copy button label, tooltips)
+_KINDS = (
+    ("notes", "📓 [Notes]({url})\n", "📓 Notes: Not available\n", "📓 Copy Unit {u} Notes | {t}", _NOTES_TOOLTIPS),
+    ("ppt", "📄 [PPT]({url})\n", "📄 PPT: Not available\n", "📄 Copy Unit {u} PPT | {t}", _PPT_TOOLTIPS),
+    ("pyq", "📋 [PYQs]({url})\n", "📋 PYQs: Not available\n", "📋 Copy Unit {u} PYQs | {t}", _PYQ_TOOLTIPS),
+)
+
+# Resource message footers for subscribers and for free users
+_FOOTER_SUB = "\n{dots}\n{g}\n✅ *You have an active subscription* ✨\n{g}"
+_FOOTER_FREE = (
+    "\n{dots}\n{g}\n"
+    "🔢 *Searches Used:* {used}/4\n"
+    "\n💰 *Upgrade to Premium*\n"
+    "- Price: ₹21 for 1 week of unlimited searches\n"
+    "- Payment: Send ₹21 to *{upi}* via UPI\n"
+    "- After payment, use /verify_payment with your UPI reference ID\n"
+    "{g}"
+)
+
+# A copy button of a resource message, turned into an InlineKeyboardButton on send
+ButtonSpec = namedtuple("ButtonSpec", ["label", "url"])
+
+@functools.lru_cache(maxsize=256)
 def create_loading_messages(subject_code):
-    """Create a sequence of loading messages for animated display with color transitions."""
-    # Define color transition patterns using emoji gradients
-    color_transitions = [
-        "🟩🟨🟧🟥",  # Green to yellow to orange to red
-        "🟦🟪🟫⬜",  # Blue to purple to brown to white
-        "⬜🟦🟩🟨",  # White to blue to green to yellow
-        "🟪🟦⬜🟨",  # Purple to blue to white to yellow
-        "🟥🟧🟨🟩"   # Red to orange to yellow to green
-    ]
+    """Create a sequence of loading messages for animated display with color transitions.
     
-    # Using Unicode block elements for background
-    backgrounds = [
-        "░░░░░░░░",  # Light shade
-        "▒▒▒▒▒▒▒▒",  # Medium shade
-        "▓▓▓▓▓▓▓▓",  # Dark shade
-        "█████████"   # Full block
-    ]
-    
-    import random
+    The colors are picked by an RNG seeded with the subject code, so a subject
+    always gets the same sequence and the result can be cached.
+    """
+    rng = random.Random(subject_code)
     
     # Create sequence with varying colors and backgrounds
-    loading_sequence = [
-        f"{random.choice(color_transitions)}\n{backgrounds[0]}\n🔍 *Searching for {subject_code} resources...*",
-        f"{random.choice(color_transitions)}\n{backgrounds[1]}\n🔎 *Fetching {subject_code} information...*",
-        f"{random.choice(color_transitions)}\n{backgrounds[2]}\n📚 *Preparing {subject_code} resources...*",
-        f"{random.choice(color_transitions)}\n{backgrounds[3]}\n✨ *Organizing {subject_code} materials...*"
-    ]
+    loading_sequence = (
+        f"{rng.choice(_COLOR_TRANSITIONS)}\n{_BACKGROUNDS[0]}\n🔍 *Searching for {subject_code} resources...*",
+        f"{rng.choice(_COLOR_TRANSITIONS)}\n{_BACKGROUNDS[1]}\n🔎 *Fetching {subject_code} information...*",
+        f"{rng.choice(_COLOR_TRANSITIONS)}\n{_BACKGROUNDS[2]}\n📚 *Preparing {subject_code} resources...*",
+        f"{rng.choice(_COLOR_TRANSITIONS)}\n{_BACKGROUNDS[3]}\n✨ *Organizing {subject_code} materials...*"
+    )
     return loading_sequence
 
+# Formatted resource messages kept ready to send, keyed on subject, links and
+# user state. Only a share (RESOURCE_MESSAGE_CACHE_P) of misses is stored: a
+# popular message gets stored within a few requests, while one-off lookups
+# mostly never take up space. The oldest entry goes once the cache is full.
+RESOURCE_MESSAGE_CACHE_SIZE = 512
+RESOURCE_MESSAGE_CACHE_P = 0.3
+_resource_messages = {}
+_resource_messages_acc = 0.0
+_resource_messages_lock = threading.Lock()
+
 def format_resource_message(subject_code, subject_name, resources, searches_used, is_subscribed, upi_id):
-    """Format the resource message with proper emoji and markdown and create inline keyboard."""
-    
-    # Emoji tooltips for different resource types
-    notes_tooltips = [
-        "📝 Take better notes with these!", 
-        "✏️ Perfect study material!", 
-        "📚 Study smart, not hard!", 
-        "🧠 Knowledge at your fingertips!",
-        "📓 Comprehensive class notes!"
-    ]
-    
-    ppt_tooltips = [
-        "🖼️ Visual learning rocks!", 
-        "👨‍🏫 Straight from the professor!", 
-        "📊 Slides to success!", 
-        "💻 PowerPoint perfection!",
-        "🎬 Presentation magic!"
-    ]
-    
-    pyq_tooltips = [
-        "📝 Practice makes perfect!", 
-        "🔍 See what to expect!", 
-        "❓ Test your knowledge!", 
-        "🎯 Aim for top marks!",
-        "⏳ Save study time!"
-    ]
-    
-    # Import for random selection
-    import random
-    
-    # Define color gradients for header and footer
-    color_gradients = [
-        "🟥🟧🟨🟩",  # Red to orange to yellow to green
-        "🟩🟦🟪🟥",  # Green to blue to purple to red
-        "🟦🟪🟥🟧",  # Blue to purple to red to orange
-        "🟨🟩🟦🟪",  # Yellow to green to blue to purple
-        "🟪🟦🟩🟨"   # Purple to blue to green to yellow
-    ]
+    """Format the resource message with proper emoji and markdown and list its copy buttons.
+    
+    Returns the message text and a tuple of ButtonSpec; pass the specs to
+    build_resource_keyboard when the message is actually sent.
+    
+    Messages are memoized on the subject, its links and the user's state, so the
+    random decorations are picked when a message is first built and reused after.
+    Subscribers have no per-user state in the key: once a subscriber message for
+    a subject and its links is cached, every subscriber gets that one frozen set
+    of decorations until the entry is evicted.
+    """
+    # Hashable snapshot of the links, e.g. ((1, (('notes', url),)), (2, ()), ...)
+    fingerprint = tuple((unit, tuple(sorted(resources.get(unit, {}).items()))) for unit in range(1, 7))
+    if is_subscribed:
+        # Subscribers aren't shown a search count, so they all share one message
+        searches_used = None
+    key = (subject_code, subject_name, fingerprint, searches_used, is_subscribed, upi_id)
+    
+    with _resource_messages_lock:
+        cached = _resource_messages.get(key)
+    if cached is not None:
+        return cached
+    
+    result = _build_resource_message(*key)
+    _remember_resource_message(key, result)
+    return result
+
+def _remember_resource_message(key, result):
+    """Store a freshly built message for every 1/RESOURCE_MESSAGE_CACHE_P-th miss."""
+    global _resource_messages_acc
+    with _resource_messages_lock:
+        # Deterministic sampling: add p per miss and store when it reaches one
+        _resource_messages_acc += RESOURCE_MESSAGE_CACHE_P
+        if _resource_messages_acc < 1.0:
+            return
+        _resource_messages_acc -= 1.0
+        _resource_messages[key] = result
+        if len(_resource_messages) > RESOURCE_MESSAGE_CACHE_SIZE:
+            del _resource_messages[next(iter(_resource_messages))]
+
+def _build_resource_message(subject_code, subject_name, fingerprint, searches_used, is_subscribed, upi_id):
+    """Build the (message, buttons) pair for format_resource_message."""
+    resources = {unit: dict(links) for unit, links in fingerprint}
     
-    # Choose random gradient for this message
-    header_gradient = random.choice(color_gradients)
-    footer_gradient = random.choice(color_gradients)
+    # Draw every random gradient and tooltip for this message up front:
+    # header, footer and one gradient per unit, plus one tooltip per unit and kind
+    header_gradient, footer_gradient, *unit_gradients = random.choices(_COLOR_GRADIENTS, k=8)
+    tooltips = {kind: random.choices(tips, k=6) for kind, *_, tips in _KINDS}
     
-    # Create fancy background with dots
-    dots = "•" * 20
+    # Message pieces, joined once at the end
+    parts = []
     
     # Header with a more attractive design and color-shifting background
-    message = (
+    parts.append(
         f"{header_gradient}\n"
-        f"{dots}\n"
+        f"{_DOTS}\n"
         f"🎓 *{subject_code}: {subject_name}*\n"
-        f"{'✦'*15}\n"
-        f"{dots}\n\n"
+        f"{_SEP}\n"
+        f"{_DOTS}\n\n"
     )
     
-    # Create a keyboard for quick copy buttons
-    keyboard = []
+    # Specs for the quick copy buttons
+    buttons = []
     
     # Add resources by unit - improved formatting with color transitions
     for unit in range(1, 7):  # Units 1-6
-        # Choose a random gradient for each unit to create a color-shifting effect
-        unit_gradient = random.choice(color_gradients)
-        wave_pattern = "\u25fa\u25fb\u25fc\u25fd" * 5  # Alternating square patterns
-        
-        message += f"{unit_gradient}\n"
-        message += f"📌 *UNIT {unit}* 📌\n"
-        message += f"{wave_pattern}\n"
+        # A different gradient for each unit creates a color-shifting effect
+        parts.append(_UNIT_HEADER.format(g=unit_gradients[unit - 1], u=unit, w=_WAVE_PATTERN))
         
-        # Notes
-        if 'notes' in resources[unit]:
-            notes_link = resources[unit]['notes']
-            message += f"📓 [Notes]({notes_link})\n"
-            # Add copy button for notes with random tooltip
-            notes_tooltip = random.choice(notes_tooltips)
-            keyboard.append([
-                InlineKeyboardButton(f"📓 Copy Unit {unit} Notes | {notes_tooltip}", url=notes_link)
-            ])
-        else:
-            message += f"📓 Notes: Not available\n"
-            
-        # PPT
-        if 'ppt' in resources[unit]:
-            ppt_link = resources[unit]['ppt']
-            message += f"📄 [PPT]({ppt_link})\n"
-            # Add copy button for PPT with random tooltip
-            ppt_tooltip = random.choice(ppt_tooltips)
-            keyboard.append([
-                InlineKeyboardButton(f"📄 Copy Unit {unit} PPT | {ppt_tooltip}", url=ppt_link)
-            ])
-        else:
-            message += f"📄 PPT: Not available\n"
+        # Notes, PPT and PYQs, each with a copy button carrying a random tooltip
+        unit_resources = resources.get(unit, {})
+        for kind, link_tmpl, missing, btn_tmpl, _ in _KINDS:
+            link = unit_resources.get(kind)
+            if link is not None:
+                parts.append(link_tmpl.format(url=link))
+                buttons.append(ButtonSpec(btn_tmpl.format(u=unit, t=tooltips[kind][unit - 1]), link))
+            else:
+                parts.append(missing)
             
-        # PYQ
-        if 'pyq' in resources[unit]:
-            pyq_link = resources[unit]['pyq']
-            message += f"📋 [PYQs]({pyq_link})\n"
-            # Add copy button for PYQ with random tooltip
-            pyq_tooltip = random.choice(pyq_tooltips)
-            keyboard.append([
-                InlineKeyboardButton(f"📋 Copy Unit {unit} PYQs | {pyq_tooltip}", url=pyq_link)
-            ])
-        else:
-            message += f"📋 PYQs: Not available\n"
-            
-        message += "\n"
+        parts.append("\n")
     
     # Footer with subscription/usage information - enhanced design with color gradient
-    if is_subscribed:
-        message += (
-            f"\n{dots}\n"
-            f"{footer_gradient}\n"
-            f"✅ *You have an active subscription* ✨\n"
-            f"{footer_gradient}"
-        )
-    else:
-        message += (
-            f"\n{dots}\n"
-            f"{footer_gradient}\n"
-            f"🔢 *Searches Used:* {searches_used}/4\n"
-            f"\n💰 *Upgrade to Premium*\n"
-            f"- Price: ₹21 for 1 week of unlimited searches\n"
-            f"- Payment: Send ₹21 to *{upi_id}* via UPI\n"
-            f"- After payment, use /verify_payment with your UPI reference ID\n"
-            f"{footer_gradient}"
-        )
+    footer = _FOOTER_SUB if is_subscribed else _FOOTER_FREE
+    parts.append(footer.format(dots=_DOTS, g=footer_gradient, used=searches_used, upi=upi_id))
     
-    # Create the reply markup if we have any buttons
-    reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
+    message = "".join(parts)
     
-    return message, reply_markup
\ No newline at end of file
+    return message, tuple(buttons)
+
+def build_resource_keyboard(buttons):
+    """Turn the button specs from format_resource_message into a one-button-per-row keyboard."""
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup([[InlineKeyboardButton(b.label, url=b.url)] for b in buttons])
\ No newline at end of file